@@ -1,18 +1,41 @@
 import os
 
 from apiflask import APIFlask
-from flask import redirect, url_for
+from flask import current_app, redirect, url_for
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_mail import Mail
+from werkzeug.local import LocalProxy
 
 from config import base_dir, Config
+from .activity import LastSeenBuffer
+from .cache import ResponseCache, TokenCache
+from .hashing import PasswordHasher
+from .mail_pool import MailPool
+from .payments import StripeGateway
+from .rendering import TemplateCache
+from .reference import ReferenceData
+from .signing import RevocationList
 
 db = SQLAlchemy()
 migrate = Migrate()
 cors = CORS()
 mail = Mail()
+mail_pool = MailPool(mail)
+mail_templates = TemplateCache([
+    "user/success.txt", "user/success.html",
+    "admin/success.txt", "admin/success.html",
+    "admin/digest.txt", "admin/digest.html"
+])
+token_cache = TokenCache()
+response_cache = ResponseCache()
+last_seen = LastSeenBuffer()
+password_hasher = PasswordHasher()
+revoked_tokens = RevocationList()
+reference_data = ReferenceData()
+payments = StripeGateway()
+token_store = LocalProxy(lambda: current_app.extensions["token_store"])
 
 
 def create_app(config=Config) -> APIFlask:
@@ -35,6 +58,17 @@ def create_app(config=Config) -> APIFlask:
     if app.config["USE_CORS"]:
         cors.init_app(app)
     mail.init_app(app)
+    mail_pool.init_app(app)
+    mail_templates.init_app(app)
+    token_cache.init_app(app)
+    response_cache.init_app(app)
+    last_seen.init_app(app)
+    password_hasher.init_app(app)
+    revoked_tokens.init_app(app)
+    reference_data.init_app(app)
+    payments.init_app(app)
+    from .token_stores import create_token_store
+    app.extensions["token_store"] = create_token_store(app)
 
     # Blueprints
     register_blueprints(app)
@@ -50,12 +84,21 @@ def create_app(config=Config) -> APIFlask:
 
 def register_blueprints(app: APIFlask) -> None:
     """Register application blueprints."""
+    from .catalog import catalog
+    app.register_blueprint(catalog)
+
     from .categories import categories
     app.register_blueprint(categories, url_prefix="/api")
 
     from .carts import carts
     app.register_blueprint(carts, url_prefix="/api")
 
+    from .events import events
+    app.register_blueprint(events)
+
+    from .outbox import outbox
+    app.register_blueprint(outbox)
+
     from .populate import populate
     app.register_blueprint(populate)
 
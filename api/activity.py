@@ -0,0 +1,100 @@
+import atexit
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+
+from sqlalchemy import bindparam, update
+
+
+class LastSeenBuffer:
+    """Write-behind buffer of users last seen timestamps.
+
+    Authenticated requests only record timestamps in memory, they are
+    written to the database in one batched UPDATE every flush interval or
+    as soon as the buffer fills up.
+    """
+    def __init__(self):
+        self.app = None
+        self.flushes = 0
+        self._pending = {}
+        self._seen = {}
+        self._lock = Lock()
+        self._wake = Event()
+        self._thread = None
+        self._registered = False
+
+    def init_app(self, app):
+        """Configure buffer from application config."""
+        self.app = app
+        self.size = app.config["LAST_SEEN_BUFFER_SIZE"]
+        self.interval = app.config["LAST_SEEN_FLUSH_INTERVAL"]
+        self.granularity = timedelta(seconds=app.config["LAST_SEEN_GRANULARITY"])
+        with self._lock:
+            self._pending.clear()
+            self._seen.clear()
+        if not self._registered:
+            atexit.register(self._flush_at_exit)
+            self._registered = True
+
+    def touch(self, user):
+        """Record user activity unless it was recorded recently."""
+        now = datetime.utcnow()
+        with self._lock:
+            seen = self._seen.get(user.user_id, user.last_seen)
+            if seen is not None and now - seen < self.granularity:
+                return
+            self._seen[user.user_id] = now
+            self._pending[user.user_id] = now
+            full = len(self._pending) >= self.size
+
+        if self.interval > 0:
+            self._start()
+            if full:
+                self._wake.set()
+        elif full:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write pending timestamps to the database, return number of users updated."""
+        from . import db
+        from .models import User
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            threshold = datetime.utcnow() - self.granularity
+            self._seen = {k: v for k, v in self._seen.items() if v > threshold}
+        if not pending:
+            return 0
+
+        stmt = update(User.__table__) \
+            .where(User.__table__.c.user_id == bindparam("b_user_id")) \
+            .values(last_seen=bindparam("b_last_seen"))
+        params = [{"b_user_id": k, "b_last_seen": v} for k, v in pending.items()]
+        with db.get_engine(self.app).begin() as conn:
+            conn.execute(stmt, params)
+        self.flushes += 1
+        return len(pending)
+
+    def _start(self):
+        """Start background flush thread once."""
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = Thread(target=self._run, daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        """Background flush loop."""
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception("Failed to flush last seen timestamps.")
+
+    def _flush_at_exit(self):
+        """Flush what is left on interpreter shutdown."""
+        try:
+            self.flush()
+        except Exception:
+            pass
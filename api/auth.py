@@ -1,4 +1,5 @@
-from apiflask import HTTPBasicAuth, HTTPTokenAuth
+from apiflask import abort, HTTPBasicAuth, HTTPTokenAuth
+from .hashing import HasherBusy
 from .models import User
 
 basic_auth = HTTPBasicAuth()
@@ -9,8 +10,11 @@ token_auth = HTTPTokenAuth()
 def verify_password(username, password):
     """HTTP Basic Authentication."""
     user = User.query.filter_by(username=username).first()
-    if user is not None and user.verify_password(password):
-        return user
+    try:
+        if user is not None and user.verify_password(password):
+            return user
+    except HasherBusy:
+        abort(503, "Server is busy, try again later.")
 
 
 @token_auth.verify_token
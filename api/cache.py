@@ -0,0 +1,286 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+from time import monotonic, time
+from urllib.parse import urlencode
+
+from flask import current_app, request, Response
+
+
+class TTLCache:
+    """Bounded in-process cache with LRU eviction and per-entry time to live."""
+    def __init__(self, maxsize: int=1024, ttl: float=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def configure(self, maxsize: int, ttl: float):
+        """Resize cache, drop all entries and reset counters."""
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self.hits = 0
+            self.misses = 0
+            self._entries.clear()
+
+    def get(self, key):
+        """Return cached value or None if key is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+
+    def set(self, key, value, ttl: float=None):
+        """Store value, ttl is capped by cache default ttl."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Remove single entry."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_where(self, predicate):
+        """Remove all entries which value matches predicate."""
+        with self._lock:
+            for key in [k for k, (_, v) in self._entries.items() if predicate(v)]:
+                del self._entries[key]
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Cache hit/miss counters."""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TokenCache(TTLCache):
+    """Cache of verified access tokens mapped to detached user snapshots."""
+    def init_app(self, app):
+        """Configure cache from application config."""
+        self.configure(
+            app.config["TOKEN_CACHE_SIZE"],
+            app.config["TOKEN_CACHE_TTL"]
+        )
+
+    def invalidate_user(self, user_id: int):
+        """Remove all cached tokens of given user."""
+        self.delete_where(lambda user: user.user_id == user_id)
+
+
+class MemoryResponseBackend:
+    """Response cache entries kept in process memory."""
+    def __init__(self, maxsize: int, ttl: float):
+        self.entries = TTLCache(maxsize, ttl)
+        self._generations = {}
+        self._lock = Lock()
+
+    def generation(self, tag: str) -> str:
+        return self._generations.get(tag, "0")
+
+    def get(self, tag: str, generation: str, key: str):
+        return self.entries.get((tag, generation, key))
+
+    def set(self, tag: str, generation: str, key: str, entry):
+        self.entries.set((tag, generation, key), entry)
+
+    def invalidate(self, tag: str):
+        with self._lock:
+            self._generations[tag] = str(int(self._generations.get(tag, "0")) + 1)
+
+
+class FileResponseBackend:
+    """Response cache entries kept as files in a directory shared by all
+    workers of the host. Point it to tmpfs, e.g. /dev/shm, to keep entries
+    in shared memory.
+
+    Entry file is a JSON header line followed by raw response body, nothing
+    read from the directory is ever unpickled or executed. The directory is
+    created private to the process user, one owned by somebody else or
+    writable by others is refused. Expired files are removed by a sweep at
+    most once per ttl.
+    """
+    def __init__(self, directory: str, ttl: float):
+        self.directory = directory
+        self.ttl = ttl
+        self._next_cleanup = time() + ttl
+        self._lock = Lock()
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        info = os.stat(directory)
+        if info.st_uid != os.geteuid() or info.st_mode & 0o022:
+            raise RuntimeError(f"Response cache directory '{directory}' must be owned by the process user "
+                               "and not writable by others.")
+
+    def generation(self, tag: str) -> str:
+        try:
+            with open(self._path(tag) + ".gen") as f:
+                return f.read()
+        except FileNotFoundError:
+            return "0"
+
+    def get(self, tag: str, generation: str, key: str):
+        path = self._entry_path(tag, generation, key)
+        try:
+            with open(path, "rb") as f:
+                header, _, body = f.read().partition(b"\n")
+            expires, etag, mimetype = json.loads(header)
+        except (FileNotFoundError, ValueError):
+            return None
+        if expires > time():
+            return etag, body, mimetype
+        self._remove(path)
+
+    def set(self, tag: str, generation: str, key: str, entry):
+        etag, body, mimetype = entry
+        path = self._entry_path(tag, generation, key)
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        self._write(path, json.dumps([time() + self.ttl, etag, mimetype]).encode() + b"\n" + body)
+        if self._next_cleanup < time():
+            self.cleanup()
+
+    def invalidate(self, tag: str):
+        self._write(self._path(tag) + ".gen", uuid.uuid4().hex.encode())
+        shutil.rmtree(self._path(tag), ignore_errors=True)
+
+    def cleanup(self) -> int:
+        """Remove entry files older than ttl. Return number of removed files."""
+        with self._lock:
+            self._next_cleanup = time() + self.ttl
+        removed = 0
+        expired = time() - self.ttl
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if root != self.directory and os.stat(path).st_mtime < expired:
+                        removed += self._remove(path)
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def _path(self, tag: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(tag.encode()).hexdigest())
+
+    def _entry_path(self, tag: str, generation: str, key: str) -> str:
+        return os.path.join(self._path(tag), hashlib.sha1(f"{generation}:{key}".encode()).hexdigest())
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        """Write file atomically so readers never see partial content."""
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+class ResponseCache:
+    """Read-through cache of serialized JSON responses with strong ETags.
+
+    Entries are grouped by tags, e.g. 'product:1', and a write invalidates
+    every entry of its tags by switching tag generation. Generation is read
+    before the view runs, so a response built from data older than the
+    invalidation is stored under the old generation and never served.
+    """
+    def __init__(self):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        """Configure cache backend from application config."""
+        backend = app.config["RESPONSE_CACHE"]
+        self.hits = 0
+        self.misses = 0
+        if backend == "memory":
+            self.backend = MemoryResponseBackend(
+                app.config["RESPONSE_CACHE_SIZE"], app.config["RESPONSE_CACHE_TTL"]
+            )
+        elif backend == "file":
+            self.backend = FileResponseBackend(
+                app.config["RESPONSE_CACHE_DIR"], app.config["RESPONSE_CACHE_TTL"]
+            )
+        elif backend == "none":
+            self.backend = None
+        else:
+            raise RuntimeError(f"Unknown response cache '{backend}'.")
+
+    def cached(self, tag):
+        """Cache view response. `tag` is called with view arguments and returns entry tag."""
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if self.backend is None:
+                    return f(*args, **kwargs)
+                entry_tag = tag(**request.view_args)
+                generation = self.backend.generation(entry_tag)
+                key = request.path + "?" + urlencode(sorted(request.args.items(multi=True)))
+                entry = self.backend.get(entry_tag, generation, key)
+                if entry is None:
+                    self.misses += 1
+                    response = current_app.make_response(f(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    body = response.get_data()
+                    entry = (hashlib.sha256(body).hexdigest()[:32], body, response.mimetype)
+                    self.backend.set(entry_tag, generation, key, entry)
+                else:
+                    self.hits += 1
+
+                etag, body, mimetype = entry
+                response = Response(body, mimetype=mimetype)
+                response.set_etag(etag)
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags: str):
+        """Invalidate all entries of given tags. Call it after commit."""
+        if self.backend is not None:
+            for tag in tags:
+                self.backend.invalidate(tag)
+
+    def stats(self) -> dict:
+        """Cache hit/miss counters."""
+        return {"hits": self.hits, "misses": self.misses}
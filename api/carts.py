@@ -2,11 +2,12 @@ import stripe
 from apiflask import abort, APIBlueprint
 from flask import current_app, request
 
+from . import reference_data
 from .auth import token_auth
-from .email import send_mail
-from .schemas import CartSchema, CheckoutSchema
-from .models import db, Cart, CartStatus
-from .utils import checkout_response
+from .schemas import CartSchema, CartItemsChangeSchema, CartPaginationSchema, CheckoutSchema, \
+    PaginationSchema
+from .models import db, Cart, WebhookEvent
+from .utils import checkout_response, keyset_paginate, paginated_response
 
 carts = APIBlueprint("carts", __name__)
 
@@ -18,11 +19,30 @@ carts = APIBlueprint("carts", __name__)
 def new():
     """Create new cart."""
     user = token_auth.current_user
-    status = CartStatus.query.filter_by(name="ready to pay").first()
-    cart = Cart(user=user, status=status)
+    cart = Cart(user=user, status_id=reference_data.status_id("ready to pay"))
     db.session.add(user)
     db.session.commit()
-    return cart 
+    return cart.reload()
+
+
+@carts.get("/carts")
+@carts.auth_required(token_auth)
+@carts.input(PaginationSchema, location="query")
+@carts.output(CartPaginationSchema)
+@carts.doc(summary="Retrieve your carts.", description="Retrieve carts of authenticated user. Pass `after` for cursor pagination.")
+def all(query):
+    """Retrieve your carts."""
+    per_page = query.get("per_page", current_app.config["CARTS_PER_PAGE"])
+    carts = Cart.query.filter_by(user_id=token_auth.current_user.user_id).options(*Cart.list_options())
+    if "after" in query:
+        carts, pagination = keyset_paginate(
+            carts, [Cart.cart_id], query["after"], per_page, query["with_total"]
+        )
+        return paginated_response(carts, pagination)
+
+    pagination = carts.order_by(Cart.cart_id).paginate(page=query.get("page", 1), per_page=per_page)
+    carts = pagination.items
+    return paginated_response(carts, pagination)
 
 
 @carts.post("/carts/<int:cart_id>/products/<int:product_id>")
@@ -34,7 +54,20 @@ def add(cart_id, product_id):
     cart = Cart.retrieve(cart_id=cart_id).validate_paid()
     cart = cart.add_product(product_id)
     db.session.commit()
-    return cart
+    return cart.reload()
+
+
+@carts.patch("/carts/<int:cart_id>/items")
+@carts.auth_required(token_auth)
+@carts.input(CartItemsChangeSchema)
+@carts.output(CartSchema)
+@carts.doc(summary="Change many cart items.", description="Set `quantity` or add `delta` to quantity of many products at once. Items with quantity 0 or less are removed. You have to own this cart to change it.")
+def update_items(cart_id, data):
+    """Change many cart items."""
+    cart = Cart.retrieve(cart_id=cart_id).validate_paid()
+    cart.update_items(data["items"])
+    db.session.commit()
+    return cart.reload()
 
 
 @carts.get("/carts/<int:cart_id>")
@@ -66,37 +99,23 @@ def checkout(cart_id):
     """Create checkout session."""
     cart = Cart.retrieve(cart_id=cart_id).validate_paid().validate_empty()
     url = cart.create_checkout_session()
+    db.session.commit()
     return checkout_response(url)
 
 
 @carts.post("/event")
 @carts.doc(hide=True)
 def new_event():
-    """Event for Stripe Checkout Webhook."""
-    stripe.api_key = current_app.config["STRIPE_SECRET_KEY"]
-    event = None
-    payload = request.data 
-    signature = request.headers["STRIPE_SIGNATURE"]
-
+    """Event for Stripe Checkout Webhook. Event is only verified and stored,
+    it's processed later by events worker, see api/events.py."""
+    payload = request.get_data(as_text=True)
     try:
         event = stripe.Webhook.construct_event(
-            payload, signature, current_app.config["STRIPE_WEBHOOK_SECRET"]
+            payload, request.headers.get("Stripe-Signature", ""), current_app.config["STRIPE_WEBHOOK_SECRET"]
         )
-    except Exception as e:
+    except (ValueError, stripe.error.SignatureVerificationError):
         abort(400)
 
-    if event["type"] == "checkout.session.completed":
-        session = stripe.checkout.Session.retrieve(
-            event["data"]["object"]["id"], expand=["line_items"]
-        )
-
-        cart_id = session.metadata["cart_id"]
-        cart = Cart.query.filter_by(cart_id=cart_id).first()
-        status = CartStatus.query.filter_by(name="paid").first()
-        cart.status = status
-        db.session.commit()
-
-        send_mail("Thanks for purchase!", cart.user.email, "user/success", cart=cart)
-        send_mail(f"Purchase from {cart.user.username}!", current_app.config["ADMIN_EMAIL"], "admin/success", cart=cart)
-    
+    WebhookEvent.receive(event["id"], event["type"], payload)
+    db.session.commit()
     return {"success": True}
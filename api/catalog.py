@@ -0,0 +1,210 @@
+import csv
+import io
+import json
+import math
+import os
+
+import click
+from flask import Blueprint
+from sqlalchemy import func, insert, select
+
+from . import response_cache, search
+from .models import db, Product, ProductCategory
+
+catalog = Blueprint("catalog", __name__)
+
+IMPORT_FORMATS = {
+    ".csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson"
+}
+IMPORT_CHUNK_SIZE = 10000
+IMPORT_MAX_ERRORS = 1000
+# Replacement character of bytes which are not valid UTF-8.
+INVALID_CHAR = "\ufffd"
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FIELDS = ("product_id", "name", "description", "price", "category_id", "updated_at")
+
+
+def read_csv(stream):
+    """Parse CSV stream with header row, yield row number and record.
+    Leading BOM of spreadsheet exports is skipped. Record of malformed row
+    or row with invalid UTF-8 is None."""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace", newline=""))
+    row = 0
+    while True:
+        row += 1
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error:
+            yield row, None
+            continue
+        if any(INVALID_CHAR in value for value in record.values() if isinstance(value, str)):
+            record = None
+        yield row, record
+
+
+def read_ndjson(stream):
+    """Parse newline delimited JSON stream, yield line number and record.
+    Record of invalid line is None."""
+    for row, line in enumerate(stream, 1):
+        try:
+            line = line.decode("utf-8")
+        except UnicodeDecodeError:
+            yield row, None
+            continue
+        if not line.strip():
+            continue
+        try:
+            yield row, json.loads(line)
+        except ValueError:
+            yield row, None
+
+
+READERS = {
+    "csv": read_csv,
+    "ndjson": read_ndjson
+}
+
+
+def validate_record(record, category_ids: set):
+    """Validate imported product against preloaded category ids, without
+    per record queries. Return product values and errors."""
+    if not isinstance(record, dict):
+        return None, {"_record": ["Invalid record."]}
+    errors = {}
+
+    name = record.get("name")
+    if not isinstance(name, str) or not name.strip():
+        errors["name"] = ["Missing data for required field."]
+    elif len(name) > 120:
+        errors["name"] = ["Longer than maximum length 120."]
+
+    description = record.get("description") or None
+    if description is not None and not isinstance(description, str):
+        errors["description"] = ["Not a valid string."]
+
+    try:
+        price = float(record.get("price"))
+    except (TypeError, ValueError):
+        errors["price"] = ["Not a valid number."]
+    else:
+        if not math.isfinite(price) or price < 0:
+            errors["price"] = ["Must be greater than or equal to 0.0."]
+
+    value = record.get("category_id")
+    try:
+        if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+            raise ValueError
+        category_id = int(value)
+    except (TypeError, ValueError):
+        errors["category_id"] = ["Not a valid integer."]
+    else:
+        if category_id not in category_ids:
+            errors["category_id"] = ["Category doesn't exist."]
+
+    if errors:
+        return None, errors
+    return {"name": name, "description": description, "price": price, "category_id": category_id}, None
+
+
+def import_products(records, chunk_size: int=IMPORT_CHUNK_SIZE, max_errors: int=IMPORT_MAX_ERRORS) -> dict:
+    """Insert valid records in chunks, one executemany and one transaction
+    per chunk. Invalid records are skipped and reported, at most `max_errors`
+    of them in detail."""
+    category_ids = {category_id for category_id, in db.session.query(ProductCategory.category_id)}
+    report = {"imported": 0, "failed": 0, "errors": []}
+    chunk = []
+
+    def insert_chunk():
+        last_id = db.session.query(func.max(Product.product_id)).scalar() or 0
+        db.session.execute(insert(Product), chunk)
+        search.index_products_after(last_id)
+        db.session.commit()
+        response_cache.invalidate(*{f"category:{values['category_id']}" for values in chunk})
+        report["imported"] += len(chunk)
+        chunk.clear()
+
+    for row, record in records:
+        values, errors = validate_record(record, category_ids)
+        if errors:
+            report["failed"] += 1
+            if len(report["errors"]) < max_errors:
+                report["errors"].append({"row": row, "errors": errors})
+            continue
+        chunk.append(values)
+        if len(chunk) >= chunk_size:
+            insert_chunk()
+    if chunk:
+        insert_chunk()
+    return report
+
+
+def export_rows(updated_since=None, chunk_size: int=EXPORT_CHUNK_SIZE):
+    """Read products as plain rows in chunks, with server side cursor where
+    database supports it. Yield lists of rows."""
+    query = select(*[getattr(Product, field) for field in EXPORT_FIELDS]).order_by(Product.product_id)
+    if updated_since is not None:
+        query = query.where(Product.updated_at >= updated_since)
+    result = db.session.execute(query.execution_options(yield_per=chunk_size))
+    yield from result.partitions()
+
+
+def export_ndjson(updated_since=None, chunk_size: int=EXPORT_CHUNK_SIZE):
+    """Stream products as newline delimited JSON, one string per chunk."""
+    for rows in export_rows(updated_since, chunk_size):
+        yield "".join(
+            json.dumps({
+                "product_id": row.product_id,
+                "name": row.name,
+                "description": row.description,
+                "price": row.price,
+                "category_id": row.category_id,
+                "updated_at": row.updated_at.isoformat() if row.updated_at else None
+            }) + "\n" for row in rows
+        )
+
+
+def export_csv(updated_since=None, chunk_size: int=EXPORT_CHUNK_SIZE):
+    """Stream products as CSV with header row, one string per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for rows in export_rows(updated_since, chunk_size):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+EXPORTERS = {
+    "ndjson": (export_ndjson, "application/x-ndjson"),
+    "csv": (export_csv, "text/csv")
+}
+
+
+@catalog.cli.command()
+@click.option("--batch-size", type=int, default=5000, help="Products indexed per transaction.")
+def reindex(batch_size):
+    """Rebuild products full-text search index."""
+    indexed = search.rebuild_index(batch_size)
+    print(f"Successfully indexed {indexed} products.")
+
+
+@catalog.cli.command("import")
+@click.argument("file", type=click.File("rb"))
+@click.option("--format", "format_", type=click.Choice(list(READERS)), help="File format, guessed from extension by default.")
+@click.option("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="Products inserted per transaction.")
+def import_(file, format_, chunk_size):
+    """Import products from CSV or NDJSON file."""
+    format_ = format_ or IMPORT_FORMATS.get(os.path.splitext(file.name)[1].lower())
+    if format_ is None:
+        raise click.UsageError("Unknown file format, pass --format.")
+    report = import_products(READERS[format_](file), chunk_size)
+    for error in report["errors"]:
+        print(f"Row {error['row']}: {json.dumps(error['errors'])}")
+    print(f"Successfully imported {report['imported']} products, {report['failed']} failed.")
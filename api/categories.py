@@ -1,9 +1,10 @@
 from apiflask import abort, APIBlueprint
 
+from . import response_cache, search
 from .auth import token_auth
 from .decorators import admin_required
 from .schemas import ProductCategorySchema
-from .models import db, ProductCategory
+from .models import db, Cart, Product, ProductCategory
 
 categories = APIBlueprint("categories", __name__)
 
@@ -33,6 +34,7 @@ def put(category_id, data):
     category = ProductCategory.query.filter_by(category_id=category_id).first() or abort(404, "Category not found.")
     category.update(data)
     db.session.commit()
+    response_cache.invalidate(f"category:{category_id}")
     return category
 
 
@@ -44,6 +46,12 @@ def put(category_id, data):
 def delete(category_id):
     """Delete product category."""
     category = ProductCategory.query.filter_by(category_id=category_id).first() or abort(404, "Category not found.")
+    product_ids = [product_id for product_id, in category.products.with_entities(Product.product_id)]
+    cart_ids = Cart.open_with_products(product_ids)
     db.session.delete(category)
+    search.unindex_products(product_ids)
+    db.session.flush()
+    Cart.recalculate(cart_ids)
     db.session.commit()
+    response_cache.invalidate(f"category:{category_id}", *[f"product:{product_id}" for product_id in product_ids])
     return "", 204
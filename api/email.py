@@ -1,36 +1,47 @@
-from threading import Thread
-
-from flask import current_app, render_template, Flask
+from flask import current_app
 from flask_mail import Message
+from sqlalchemy import event
 
-from . import mail 
-
-
-def send_async_email(msg: Message, app: Flask):
-    """Send mail asynchronously.
-    
-    :param msg: message to send.
-    :param app: flask application object.
-    """
-    with app.app_context():
-        mail.send(msg)
+from . import mail_pool, mail_templates
+from .models import db, OutboxMessage
 
 
 def send_mail(subject: str, to: str, template: str, **kwargs):
-    """Send mail to user.
+    """Send mail to user. Message is rendered at once and with MAIL_OUTBOX
+    enabled added to the current transaction, to be sent by `flask mail
+    dispatch` after commit, otherwise it is handed to mail workers after
+    commit. Either way mail of rolled back transaction is not sent.
     
     :param subject: message subject.
     :param to: message recipient.
-    :param template: name of template to render.
+    :param template: name of precompiled template to render, see
+        api/rendering.py. Context must be plain data, not ORM objects.
     """
-    app = current_app._get_current_object()
     msg = Message(subject)
 
     msg.sender = current_app.config["MAIL_USERNAME"]
     msg.recipients = [to]
-    msg.body = render_template(template + ".txt", **kwargs)
-    msg.html = render_template(template + ".html", **kwargs)
-
-    thr = Thread(target=send_async_email, args=[msg, app])
-    thr.start()
-    return thr 
+    msg.body = mail_templates.render(template + ".txt", **kwargs)
+    msg.html = mail_templates.render(template + ".html", **kwargs)
+
+    if current_app.config["MAIL_OUTBOX"]:
+        db.session.add(OutboxMessage.from_message(msg))
+    else:
+        db.session.info.setdefault("mail", []).append(msg)
+
+
+@event.listens_for(db.session, "after_commit")
+def submit_mail(session):
+    """Hand mail of committed transaction to mail workers."""
+    for msg in session.info.pop("mail", []):
+        try:
+            mail_pool.submit(msg)
+        except Exception:
+            current_app.logger.exception(f"Failed to send mail '{msg.subject}'.")
+
+
+@event.listens_for(db.session, "after_transaction_end")
+def drop_mail(session, transaction):
+    """Drop mail of rolled back transaction."""
+    if transaction.parent is None:
+        session.info.pop("mail", None)
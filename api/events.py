@@ -0,0 +1,107 @@
+import json
+from datetime import datetime
+
+import click
+from flask import Blueprint, current_app
+
+from . import reference_data
+from .email import send_mail
+from .models import db, Cart, WebhookEvent
+from .tasks import LEASE, PeriodicTask, retry_delay
+
+events = Blueprint("events", __name__)
+
+
+def checkout_completed(data: dict):
+    """Mark cart paid and send purchase mails in one transaction. Admin gets
+    mail per order only with ADMIN_ORDER_MAIL, otherwise paid carts are
+    summed up by `flask mail digest`. Cart which is already paid is skipped,
+    so event delivered twice sends mails once."""
+    cart_id = int(data["object"]["metadata"]["cart_id"])
+    paid = reference_data.status_id("paid")
+    cart = db.session.get(Cart, cart_id)
+    if cart is None:
+        current_app.logger.warning(f"Paid cart {cart_id} doesn't exist.")
+        return
+    if cart.status_id == paid:
+        return
+    cart.status_id = paid
+    cart.paid_at = datetime.utcnow()
+
+    order = Cart.order_summary(cart_id)
+    send_mail("Thanks for purchase!", order["email"], "user/success", order=order)
+    if current_app.config["ADMIN_ORDER_MAIL"]:
+        send_mail(f"Purchase from {order['username']}!", current_app.config["ADMIN_EMAIL"], "admin/success", order=order)
+    db.session.commit()
+
+
+HANDLERS = {
+    "checkout.session.completed": checkout_completed
+}
+
+
+def process_event(event_id: str) -> bool:
+    """Lease and handle single event. Return True if event was processed."""
+    now = datetime.utcnow()
+    leased = WebhookEvent.lease(event_id, now, now + LEASE)
+    db.session.commit()
+    if not leased:
+        return False
+
+    event = db.session.get(WebhookEvent, event_id)
+    try:
+        handler = HANDLERS.get(event.type)
+        if handler is not None:
+            handler(json.loads(event.payload)["data"])
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception(f"Failed to process event {event_id}.")
+        event = db.session.get(WebhookEvent, event_id)
+        event.attempts += 1
+        event.last_error = f"{type(e).__name__}: {e}"
+        event.next_attempt_at = datetime.utcnow() + retry_delay(current_app.config["EVENTS_RETRY_DELAY"], event.attempts)
+        db.session.commit()
+        return False
+
+    event.attempts += 1
+    event.processed_at = datetime.utcnow()
+    db.session.commit()
+    return True
+
+
+def process_events(batch_size: int=None) -> int:
+    """Process due events in batches until inbox is drained, failed events
+    are retried with backoff up to EVENTS_MAX_ATTEMPTS times. Return number
+    of processed events."""
+    batch_size = batch_size or current_app.config["EVENTS_BATCH_SIZE"]
+    processed = 0
+    while True:
+        event_ids = [event_id for event_id, in db.session.query(WebhookEvent.event_id).filter(
+            WebhookEvent.processed_at.is_(None),
+            WebhookEvent.attempts < current_app.config["EVENTS_MAX_ATTEMPTS"],
+            WebhookEvent.next_attempt_at <= datetime.utcnow()
+        ).order_by(WebhookEvent.next_attempt_at).limit(batch_size)]
+        if not event_ids:
+            return processed
+        processed += sum(process_event(event_id) for event_id in event_ids)
+
+
+worker = PeriodicTask("events-worker", process_events, 0)
+
+
+@events.before_app_request
+def start_worker():
+    """Start background events worker if enabled. It is started by the
+    first request, so CLI commands don't run it."""
+    interval = current_app.config["EVENTS_PROCESS_INTERVAL"]
+    if interval > 0:
+        worker.interval = interval
+        worker.start(current_app._get_current_object())
+
+
+@events.cli.command()
+@click.option("--batch-size", type=int, help="Events fetched per query.")
+def process(batch_size):
+    """Process received Stripe webhook events."""
+    processed = process_events(batch_size)
+    print(f"Successfully processed {processed} events.")
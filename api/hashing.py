@@ -0,0 +1,85 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from threading import BoundedSemaphore, Lock
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+def normalize_method(method: str) -> str:
+    """Expand password hash method the way werkzeug stores it in the hash,
+    e.g. 'pbkdf2:sha256' -> 'pbkdf2:sha256:260000'."""
+    parts = method.split(":")
+    if parts[0] != "pbkdf2":
+        return method
+    hash_name = parts[1] if len(parts) > 1 else "sha256"
+    iterations = parts[2] if len(parts) > 2 else DEFAULT_PBKDF2_ITERATIONS
+    return f"pbkdf2:{hash_name}:{iterations}"
+
+
+class HasherBusy(Exception):
+    """Password hashing pool stayed saturated for PASSWORD_HASH_TIMEOUT."""
+
+
+class PasswordHasher:
+    """Password hashing with configurable cost.
+
+    Hashing and verification run in a bounded process pool so a burst of
+    logins can't occupy all request workers. With zero workers they run
+    inline on the calling thread. Worker processes are spawned, not forked,
+    so they don't inherit locks held by threads of the server process.
+    """
+    def __init__(self):
+        self._executor = None
+        self._slots = None
+        self._lock = Lock()
+
+    def init_app(self, app):
+        """Configure hasher from application config."""
+        self.shutdown()
+        self.method = normalize_method(app.config["PASSWORD_HASH_METHOD"])
+        self.salt_length = app.config["PASSWORD_SALT_LENGTH"]
+        self.workers = app.config["PASSWORD_HASH_WORKERS"]
+        self.timeout = app.config["PASSWORD_HASH_TIMEOUT"]
+        self._slots = BoundedSemaphore(self.workers * 2) if self.workers else None
+
+    def hash(self, password: str) -> str:
+        """Hash password with configured method and salt length."""
+        return self._call(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        """Check password against stored hash."""
+        return self._call(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """Check if stored hash was made with outdated parameters."""
+        if pwhash.count("$") < 2:
+            return True
+        method, salt, _ = pwhash.split("$", 2)
+        return method != self.method or len(salt) != self.salt_length
+
+    def shutdown(self):
+        """Stop worker processes."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _call(self, func, *args):
+        """Run func in process pool, raise HasherBusy if pool is saturated."""
+        if not self.workers:
+            return func(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HasherBusy()
+        try:
+            return self._get_executor().submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Create process pool on first use."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
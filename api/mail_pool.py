@@ -0,0 +1,157 @@
+import atexit
+import smtplib
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from time import monotonic, perf_counter
+
+_STOP = object()
+
+
+class MailPool:
+    """Fixed number of mail sending threads fed by a bounded queue.
+
+    Each worker keeps its SMTP connection open while messages keep coming
+    and closes it after MAIL_KEEPALIVE idle seconds, so a burst of messages
+    is sent over one connection per worker. When the queue is full `submit`
+    blocks up to MAIL_QUEUE_TIMEOUT seconds and then fails. With 0 workers
+    messages are sent on the calling thread.
+    """
+    def __init__(self, mail):
+        self.mail = mail
+        self.app = None
+        self.workers = 0
+        self.sent = 0
+        self.failed = 0
+        self.connections = 0
+        self.send_time = 0.0
+        self.max_send_time = 0.0
+        self._queue = Queue()
+        self._threads = []
+        self._lock = Lock()
+        self._registered = False
+
+    def init_app(self, app):
+        """Configure pool from application config."""
+        self.shutdown()
+        self.app = app
+        self.sent = 0
+        self.failed = 0
+        self.connections = 0
+        self.send_time = 0.0
+        self.max_send_time = 0.0
+        self.workers = app.config["MAIL_WORKERS"]
+        self.keepalive = app.config["MAIL_KEEPALIVE"]
+        self.timeout = app.config["MAIL_QUEUE_TIMEOUT"]
+        self._queue = Queue(app.config["MAIL_QUEUE_SIZE"])
+        if not self._registered:
+            atexit.register(self._shutdown_at_exit)
+            self._registered = True
+
+    def submit(self, msg):
+        """Queue message for sending."""
+        if self.workers <= 0:
+            with self.mail.connect() as connection:
+                self._send(connection, msg)
+            return
+        self._start()
+        try:
+            self._queue.put(msg, timeout=self.timeout)
+        except Full:
+            raise RuntimeError("Mail queue is full.")
+
+    def shutdown(self, timeout: float=None):
+        """Send queued messages and stop workers. With a timeout give up
+        waiting for workers once it passes, leaving queued messages unsent."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        deadline = None if timeout is None else monotonic() + timeout
+
+        def remaining():
+            return None if deadline is None else max(deadline - monotonic(), 0)
+
+        for _ in threads:
+            try:
+                self._queue.put(_STOP, timeout=remaining())
+            except Full:
+                break
+        for thread in threads:
+            thread.join(remaining())
+        if any(thread.is_alive() for thread in threads) and self.app is not None:
+            self.app.logger.warning(f"Mail workers did not stop in time, {self._queue.qsize()} messages left in queue.")
+
+    def stats(self) -> dict:
+        """Queue depth and sending counters."""
+        return {
+            "queued": self._queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "connections": self.connections,
+            "avg_send_time": self.send_time / self.sent if self.sent else 0.0,
+            "max_send_time": self.max_send_time
+        }
+
+    def _start(self):
+        """Start workers once."""
+        if len(self._threads) < self.workers:
+            with self._lock:
+                while len(self._threads) < self.workers:
+                    thread = Thread(target=self._run, name=f"mail-worker-{len(self._threads)}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def _run(self):
+        """Worker loop, connection is opened on first message and closed
+        when idle."""
+        with self.app.app_context():
+            connection = None
+            while True:
+                try:
+                    msg = self._queue.get(timeout=self.keepalive if connection else None)
+                except Empty:
+                    self._close(connection)
+                    connection = None
+                    continue
+                if msg is _STOP:
+                    self._close(connection)
+                    return
+                try:
+                    if connection is None:
+                        connection = self._connect()
+                    try:
+                        self._send(connection, msg)
+                    except smtplib.SMTPServerDisconnected:
+                        # Server closed idle connection, retry on new one.
+                        connection = self._connect()
+                        self._send(connection, msg)
+                except Exception:
+                    with self._lock:
+                        self.failed += 1
+                    self.app.logger.exception("Failed to send mail.")
+                    self._close(connection)
+                    connection = None
+
+    def _shutdown_at_exit(self):
+        """Send what is left on interpreter shutdown."""
+        self.shutdown(self.timeout)
+
+    def _connect(self):
+        connection = self.mail.connect().__enter__()
+        with self._lock:
+            self.connections += 1
+        return connection
+
+    def _close(self, connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+
+    def _send(self, connection, msg):
+        start = perf_counter()
+        connection.send(msg)
+        elapsed = perf_counter() - start
+        with self._lock:
+            self.sent += 1
+            self.send_time += elapsed
+            self.max_send_time = max(self.max_send_time, elapsed)
@@ -1,12 +1,55 @@
+import hashlib
+import json
+import math
 import secrets
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
-import stripe
 from apiflask import abort
 from flask import current_app
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_mail import Message
+from sqlalchemy import delete, DDL, event, exists, func, inspect, literal, select, true, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import joinedload, make_transient_to_detached, selectinload
+from sqlalchemy.sql.functions import FunctionElement
 
-from . import db
+from . import db, last_seen, password_hasher, payments, reference_data, revoked_tokens, token_cache, token_store
+from .signing import load_access_token, sign_access_token, timestamp_ms
+
+
+def upsert(model):
+    """Dialect specific INSERT which supports ON CONFLICT clause."""
+    inserts = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+    return inserts[db.engine.dialect.name](model)
+
+
+class floor_int(FunctionElement):
+    """Floor of non-negative number as integer. SQLite may lack FLOOR, but
+    its CAST truncates, which is the same for non-negative numbers."""
+    type = db.Integer()
+    inherit_cache = True
+
+
+@compiles(floor_int)
+def compile_floor_int(element, compiler, **kwargs):
+    return f"CAST(FLOOR({compiler.process(element.clauses, **kwargs)}) AS INTEGER)"
+
+
+@compiles(floor_int, "sqlite")
+def compile_floor_int_sqlite(element, compiler, **kwargs):
+    return f"CAST({compiler.process(element.clauses, **kwargs)} AS INTEGER)"
+
+
+def to_cents(price: float) -> int:
+    """Convert price to integer cents, rounding half up like `price_cents`."""
+    return math.floor(price * 100 + 0.5)
+
+
+def price_cents(price):
+    """SQL expression converting price column to integer cents with the
+    same double precision arithmetic as `to_cents`. SQL ROUND is not used,
+    PostgreSQL rounds double precision half to even."""
+    return floor_int(price * 100 + 0.5)
 
 
 class Updateable:
@@ -25,14 +68,19 @@ class Token(db.Model):
     access_token = db.Column(db.String(64), nullable=False, index=True)
     access_expiration = db.Column(db.DateTime, nullable=False)
     refresh_token = db.Column(db.String(64), nullable=False, index=True)
-    refresh_expiration = db.Column(db.DateTime, nullable=False)
+    refresh_expiration = db.Column(db.DateTime, nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.user_id"))
 
     def generate(self):
         """Generate access token."""
-        self.access_token = secrets.token_urlsafe(16)
         self.access_expiration = datetime.utcnow() + \
             timedelta(minutes=current_app.config["ACCESS_EXPIRATION_IN_MINUTES"])
+        if current_app.config["SIGNED_ACCESS_TOKENS"]:
+            self.access_token = sign_access_token(
+                self.user_id, self.access_expiration, current_app.config["SECRET_KEY"]
+            )
+        else:
+            self.access_token = secrets.token_urlsafe(16)
         self.refresh_token = secrets.token_urlsafe(16)
         self.refresh_expiration = datetime.utcnow() + \
             timedelta(days=current_app.config["REFRESH_EXPIRATION_IN_DAYS"])
@@ -41,23 +89,69 @@ class Token(db.Model):
         """Expire token."""
         self.access_expiration = datetime.utcnow()
         self.refresh_expiration = datetime.utcnow()
+        token_cache.delete(self.access_token)
+        revoked_tokens.revoke(self.access_token)
+        token_store.save(self)
 
     @staticmethod
-    def clean():
-        """Delete all tokens that expired more than yesterday."""
-        yesterday = datetime.utcnow() - timedelta(days=1)
-        Token.query.filter(Token.refresh_expiration < yesterday).delete()
+    def clean(batch_size: int=None) -> int:
+        """Delete all tokens that expired more than yesterday.
+        
+        Return number of deleted tokens.
+        """
+        batch_size = batch_size or current_app.config["TOKENS_SWEEP_BATCH_SIZE"]
+        deleted = token_store.clean(batch_size)
+        revoked_tokens.clean()
+        db.session.commit()
+        return deleted
+
+
+class RevokedToken(db.Model):
+    """SQLAlchemy model to represent 'revoked_tokens' table, signatures of
+    signed access tokens revoked before they expire."""
+    __tablename__ = "revoked_tokens"
+
+    signature = db.Column(db.String(32), primary_key=True)
+    expiration = db.Column(db.DateTime, nullable=False, index=True)
+
+    @staticmethod
+    def add(signature: str, expiration: datetime):
+        """Store revoked token, revoking it again is a no-op."""
+        db.session.execute(
+            upsert(RevokedToken).values(signature=signature, expiration=expiration)
+            .on_conflict_do_nothing(index_elements=["signature"])
+        )
+
+    @staticmethod
+    def exists(signature: str) -> bool:
+        """Check if token with given signature is revoked."""
+        return db.session.get(RevokedToken, signature) is not None
+
+    @staticmethod
+    def clean(now: datetime) -> int:
+        """Delete revoked tokens that already expired."""
+        return db.session.execute(
+            delete(RevokedToken).where(RevokedToken.expiration < now).execution_options(synchronize_session=False)
+        ).rowcount
 
 
 class CartItem(db.Model):
     """SQLAlchemy model to represent 'cart_items' table."""
     __tablename__ = "cart_items"
+    __table_args__ = (
+        db.Index("ix_cart_items_cart_product", "cart_id", "product_id", unique=True),
+    )
 
     item_id = db.Column(db.Integer, primary_key=True)
     quantity = db.Column(db.Integer, default=0)
     product_id = db.Column(db.Integer, db.ForeignKey("products.product_id"))
     cart_id = db.Column(db.Integer, db.ForeignKey("carts.cart_id"))
 
+    @property
+    def total(self) -> float:
+        """Line total computed in cents."""
+        return (self.quantity or 0) * to_cents(self.product.price) / 100
+
 
 class CartStatus(db.Model):
     """SQLAlchemy model to represent 'cart_statuses' table."""
@@ -72,79 +166,410 @@ class CartStatus(db.Model):
 class Cart(db.Model):
     """SQLAlchemy model to represent 'carts' table."""
     __tablename__ = "carts"
+    __table_args__ = (
+        db.Index("ix_carts_user_cart", "user_id", "cart_id"),
+    )
 
     cart_id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.user_id"))
     status_id = db.Column(db.Integer, db.ForeignKey("cart_statuses.status_id"))
+    item_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    subtotal_cents = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    checkout_session_id = db.Column(db.String(255))
+    checkout_url = db.Column(db.Text)
+    checkout_hash = db.Column(db.String(64))
+    checkout_expires_at = db.Column(db.DateTime)
+    paid_at = db.Column(db.DateTime, index=True)
 
-    items = db.relationship("CartItem", backref="cart", cascade="all,delete", lazy="dynamic")
+    items = db.relationship("CartItem", backref="cart", cascade="all,delete")
+
+    @property
+    def subtotal(self) -> float:
+        """Cart total of all items, kept in cents."""
+        return self.subtotal_cents / 100
+
+    @staticmethod
+    def load(**kwargs):
+        """Load cart with its user, status, items and products in one query."""
+        return Cart.query.options(
+            joinedload(Cart.user),
+            joinedload(Cart.status),
+            joinedload(Cart.items).joinedload(CartItem.product)
+        ).filter_by(**kwargs).one_or_none()
+
+    @staticmethod
+    def order_summary(cart_id: int) -> dict:
+        """Plain view model of cart for mail templates, read in one query.
+        It holds no ORM objects, so it is rendered without the session."""
+        rows = db.session.execute(
+            select(Cart.cart_id, User.username, User.email, Product.name, Product.price, CartItem.quantity)
+            .join(User, User.user_id == Cart.user_id)
+            .outerjoin(CartItem, CartItem.cart_id == Cart.cart_id)
+            .outerjoin(Product, Product.product_id == CartItem.product_id)
+            .where(Cart.cart_id == cart_id)
+            .order_by(CartItem.item_id)
+        ).all()
+        if not rows:
+            return None
+        lines = [{
+            "name": row.name,
+            "price": row.price,
+            "quantity": row.quantity,
+            "total": row.quantity * to_cents(row.price) / 100
+        } for row in rows if row.name is not None]
+        return {
+            "cart_id": rows[0].cart_id,
+            "username": rows[0].username,
+            "email": rows[0].email,
+            "lines": lines,
+            "item_count": sum(line["quantity"] for line in lines),
+            "subtotal": sum(line["quantity"] * to_cents(line["price"]) for line in lines) / 100
+        }
+
+    @staticmethod
+    def paid_digest(start: datetime, end: datetime, top: int=10) -> dict:
+        """Plain view model of carts paid in given time window: order count,
+        item count, revenue and best selling products, read in one aggregate
+        query. Totals over all products come from window functions, so only
+        `top` product rows are returned. Product rows are outer joined to the
+        order count, which is returned for carts without items too."""
+        revenue = func.sum(CartItem.quantity * price_cents(Product.price))
+        quantity = func.sum(CartItem.quantity)
+        orders = select(
+            select(func.count(Cart.cart_id)).where(Cart.paid_at >= start, Cart.paid_at < end)
+            .scalar_subquery().label("orders")
+        ).subquery()
+        products = (
+            select(
+                Product.product_id,
+                Product.name,
+                quantity.label("quantity"),
+                revenue.label("revenue_cents"),
+                func.sum(quantity).over().label("total_quantity"),
+                func.sum(revenue).over().label("total_cents")
+            )
+            .select_from(Cart)
+            .join(CartItem, CartItem.cart_id == Cart.cart_id)
+            .join(Product, Product.product_id == CartItem.product_id)
+            .where(Cart.paid_at >= start, Cart.paid_at < end)
+            .group_by(Product.product_id, Product.name)
+            .order_by(revenue.desc(), Product.product_id)
+            .limit(top)
+            .subquery()
+        )
+        rows = db.session.execute(
+            select(orders.c.orders, products)
+            .select_from(orders.outerjoin(products, true()))
+            .order_by(products.c.revenue_cents.desc(), products.c.product_id)
+        ).all()
+        return {
+            "start": start,
+            "end": end,
+            "orders": rows[0].orders,
+            "item_count": rows[0].total_quantity or 0,
+            "revenue": (rows[0].total_cents or 0) / 100,
+            "products": [{
+                "name": row.name,
+                "quantity": row.quantity,
+                "revenue": row.revenue_cents / 100
+            } for row in rows if row.product_id is not None]
+        }
 
     @staticmethod
     def retrieve(**kwargs):
-        """Retrieve cart with additional filters."""
+        """Retrieve cart of current user with additional filters. Ownership is
+        checked by the query, cart is looked up again only to tell 403 from 404."""
         from .auth import token_auth
-        cart = Cart.query.filter_by(**kwargs).first() or abort(404, "Cart not found.")
-        if cart.user != token_auth.current_user:
-            abort(403, "This is not your cart.")
+        cart = Cart.load(user_id=token_auth.current_user.user_id, **kwargs)
+        if cart is None:
+            if db.session.query(Cart.query.filter_by(**kwargs).exists()).scalar():
+                abort(403, "This is not your cart.")
+            abort(404, "Cart not found.")
         return cart
 
+    @staticmethod
+    def list_options() -> tuple:
+        """Loader options of cart listings, items are loaded by separate query
+        so page limit applies to carts."""
+        return (
+            joinedload(Cart.status),
+            selectinload(Cart.items).joinedload(CartItem.product)
+        )
+
+    def reload(self):
+        """Load cart again after commit expired it. Id is taken from identity,
+        reading expired attribute would refresh the cart first."""
+        return Cart.load(cart_id=inspect(self).identity[0])
+
+    @staticmethod
+    def open_with_products(product_ids: list) -> list:
+        """Ids of not paid carts containing any of given products."""
+        return [cart_id for cart_id, in db.session.query(Cart.cart_id).filter(
+            Cart.cart_id.in_(select(CartItem.cart_id).where(CartItem.product_id.in_(product_ids))),
+            ~Cart.status.has(name="paid")
+        )]
+
+    @staticmethod
+    def recalculate(cart_ids: list):
+        """Recompute totals of given carts from their items with one statement."""
+        if not cart_ids:
+            return
+        db.session.execute(
+            update(Cart).where(Cart.cart_id.in_(cart_ids)).values(
+                item_count=select(func.coalesce(func.sum(CartItem.quantity), 0))
+                .where(CartItem.cart_id == Cart.cart_id).scalar_subquery(),
+                subtotal_cents=select(func.coalesce(func.sum(CartItem.quantity * price_cents(Product.price)), 0))
+                .join(Product, Product.product_id == CartItem.product_id)
+                .where(CartItem.cart_id == Cart.cart_id).scalar_subquery()
+            ).execution_options(synchronize_session=False)
+        )
+
+    def change_totals(self, product_id: int, quantity: int):
+        """Add `quantity` units of product to cart totals, negative quantity subtracts."""
+        cents = select(price_cents(Product.price)).where(Product.product_id == product_id).scalar_subquery()
+        db.session.execute(
+            update(Cart).where(Cart.cart_id == self.cart_id).values(
+                item_count=Cart.item_count + quantity,
+                subtotal_cents=Cart.subtotal_cents + quantity * cents
+            ).execution_options(synchronize_session=False)
+        )
+
     def validate_paid(self):
         """Validate cart is not paid."""
-        if self.status.name == "paid":
+        if self.status_id == reference_data.status_id("paid"):
             abort(400, "Cart is paid.")
         return self
 
     def add_product(self, product_id: int):
-        """Add product to the cart."""
-        product = Product.query.get(product_id) or abort(404, "Product not found.")
-        item = self.items.filter_by(product=product).first()
-        if not item:
-            item = CartItem(cart=self, product=product)
-        item.quantity = (item.quantity + 1) if item.quantity else 1
-        db.session.add(item)
+        """Add product to the cart. Single upsert statement, so concurrent
+        adds of the same product increment one item."""
+        statement = upsert(CartItem).from_select(
+            ["cart_id", "product_id", "quantity"],
+            select(literal(self.cart_id), Product.product_id, literal(1)).where(Product.product_id == product_id)
+        ).on_conflict_do_update(
+            index_elements=["cart_id", "product_id"],
+            set_={"quantity": func.coalesce(CartItem.quantity, 0) + 1}
+        )
+        if db.session.execute(statement).rowcount == 0:
+            abort(404, "Product not found.")
+        self.change_totals(product_id, 1)
         return self
 
     def remove_product(self, product_id: int):
-        """Remove product from cart."""
-        item = self.items.filter_by(product_id=product_id).first() or abort(404, "Product not found.")
-
-        item.quantity -= 1
-        if item.quantity == 0:
-            self.items.remove(item)
-            db.session.delete(item)
+        """Remove product from cart. Item is decremented or, if it's the last
+        one, deleted by conditional statements without reading it first."""
+        item = (CartItem.cart_id == self.cart_id, CartItem.product_id == product_id)
+        quantity = func.coalesce(CartItem.quantity, 0)
+        while True:
+            decremented = db.session.execute(
+                update(CartItem).where(*item, quantity > 1).values(quantity=CartItem.quantity - 1)
+                .execution_options(synchronize_session=False)
+            )
+            if decremented.rowcount:
+                break
+            deleted = db.session.execute(
+                delete(CartItem).where(*item, quantity <= 1).execution_options(synchronize_session=False)
+            )
+            if deleted.rowcount:
+                break
+            # Item was incremented between both statements, try again.
+            if not db.session.query(exists().where(*item)).scalar():
+                abort(404, "Product not found.")
+        self.change_totals(product_id, -1)
+
+    def update_items(self, changes: list):
+        """Apply item changes of many products at once. Product ids are checked
+        with one query, quantities are set or incremented with batched upserts
+        and items left without quantity are deleted with one statement."""
+        product_ids = {change["product_id"] for change in changes}
+        found = {product_id for product_id, in db.session.query(Product.product_id).filter(Product.product_id.in_(product_ids))}
+        if found != product_ids:
+            abort(404, "Product not found.", detail={"product_ids": sorted(product_ids - found)})
+
+        # Fold changes of each product in order, e.g. quantity 2 and delta 1 set 3.
+        quantities, deltas = {}, {}
+        for change in changes:
+            product_id = change["product_id"]
+            if "quantity" in change:
+                deltas.pop(product_id, None)
+                quantities[product_id] = change["quantity"]
+            elif product_id in quantities:
+                quantities[product_id] += change["delta"]
+            else:
+                deltas[product_id] = deltas.get(product_id, 0) + change["delta"]
+
+        statement = upsert(CartItem)
+        set_quantity = statement.on_conflict_do_update(
+            index_elements=["cart_id", "product_id"],
+            set_={"quantity": statement.excluded.quantity}
+        )
+        add_quantity = statement.on_conflict_do_update(
+            index_elements=["cart_id", "product_id"],
+            set_={"quantity": func.coalesce(CartItem.quantity, 0) + statement.excluded.quantity}
+        )
+        for statement, values in [(set_quantity, quantities), (add_quantity, deltas)]:
+            if values:
+                db.session.execute(statement, [
+                    {"cart_id": self.cart_id, "product_id": product_id, "quantity": quantity}
+                    for product_id, quantity in values.items()
+                ])
+        db.session.execute(
+            delete(CartItem).where(
+                CartItem.cart_id == self.cart_id,
+                CartItem.product_id.in_(product_ids),
+                func.coalesce(CartItem.quantity, 0) <= 0
+            ).execution_options(synchronize_session=False)
+        )
+        Cart.recalculate([self.cart_id])
+        return self
 
     def validate_empty(self):
         """Validate cart is not empty."""
-        if not self.items.all():
+        if not db.session.query(exists().where(CartItem.cart_id == self.cart_id)).scalar():
             abort(400, "Cart is empty.")
         return self
 
+    def content_hash(self, currency: str) -> str:
+        """Hash of everything checkout session is made of."""
+        content = [currency, current_app.config["CHECKOUT_SUCCESS"], current_app.config["CHECKOUT_FAIL"]]
+        content += sorted((item.product_id, item.product.name, to_cents(item.product.price), item.quantity)
+                          for item in self.items)
+        return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
     def create_checkout_session(self, currency: str="usd"):
-        """Create Stripe Checkout Session."""
-        stripe.api_key = current_app.config["STRIPE_SECRET_KEY"]
-        line_items = [
-            {
-                "price_data": {
-                    "product_data": {
-                        "name": item.product.name
+        """Create Stripe Checkout Session or reuse one made for the same cart
+        content which doesn't expire soon."""
+        content_hash = self.content_hash(currency)
+        now = datetime.utcnow()
+        if self.checkout_url and self.checkout_hash == content_hash and \
+                self.checkout_expires_at > now + timedelta(minutes=5):
+            return self.checkout_url
+
+        # Expiration is derived from time window of the request, so repeated
+        # requests within the window send equal params with equal idempotency
+        # key and Stripe returns the same session.
+        ttl = current_app.config["CHECKOUT_SESSION_TTL"]
+        window = int(now.replace(tzinfo=timezone.utc).timestamp()) // ttl
+        session = payments.create_checkout_session({
+            "line_items": [
+                {
+                    "price_data": {
+                        "product_data": {
+                            "name": item.product.name
+                        },
+                        "unit_amount": to_cents(item.product.price),
+                        "currency": currency,
                     },
-                    "unit_amount": int(item.product.price * 100.0),
-                    "currency": currency,
-                },
-                "quantity": item.quantity,
-            }
-            for item in self.items
-        ]
-
-        checkout_session = stripe.checkout.Session.create(
-            line_items=line_items,
-            payment_method_types=["card"],
-            mode="payment",
-            metadata={"cart_id": self.cart_id},
-            success_url=current_app.config["CHECKOUT_SUCCESS"],
-            cancel_url=current_app.config["CHECKOUT_FAIL"]
+                    "quantity": item.quantity,
+                }
+                for item in sorted(self.items, key=lambda item: item.product_id)
+            ],
+            "payment_method_types": ["card"],
+            "mode": "payment",
+            "metadata": {"cart_id": self.cart_id},
+            "success_url": current_app.config["CHECKOUT_SUCCESS"],
+            "cancel_url": current_app.config["CHECKOUT_FAIL"],
+            "expires_at": (window + 2) * ttl
+        }, idempotency_key=f"checkout-{self.cart_id}-{content_hash[:32]}-{window}")
+
+        self.checkout_session_id = session["id"]
+        self.checkout_url = session["url"]
+        self.checkout_hash = content_hash
+        self.checkout_expires_at = datetime.utcfromtimestamp(session["expires_at"])
+        return self.checkout_url
+
+
+class WebhookEvent(db.Model):
+    """SQLAlchemy model to represent 'events' table, inbox of received
+    Stripe webhook events processed by `flask events process`."""
+    __tablename__ = "events"
+
+    event_id = db.Column(db.String(255), primary_key=True)
+    type = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    processed_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    last_error = db.Column(db.Text)
+
+    @staticmethod
+    def receive(event_id: str, type: str, payload: str):
+        """Store event unless it was already received, Stripe delivers
+        events at least once."""
+        db.session.execute(
+            upsert(WebhookEvent).values(event_id=event_id, type=type, payload=payload)
+            .on_conflict_do_nothing(index_elements=["event_id"])
+        )
+
+    @staticmethod
+    def lease(event_id: str, now: datetime, until: datetime) -> bool:
+        """Claim due event till given time, so concurrent workers skip it."""
+        return db.session.execute(
+            update(WebhookEvent).where(
+                WebhookEvent.event_id == event_id,
+                WebhookEvent.processed_at.is_(None),
+                WebhookEvent.next_attempt_at <= now
+            ).values(next_attempt_at=until).execution_options(synchronize_session=False)
+        ).rowcount == 1
+
+
+class OutboxMessage(db.Model):
+    """SQLAlchemy model to represent 'outbox' table, rendered mail written
+    in the transaction which caused it and sent by `flask mail dispatch`."""
+    __tablename__ = "outbox"
+
+    message_id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(255))
+    recipients = db.Column(db.Text, nullable=False)
+    body = db.Column(db.Text)
+    html = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    sent_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    last_error = db.Column(db.Text)
+    lease_id = db.Column(db.String(32), index=True)
+
+    @staticmethod
+    def from_message(msg: Message) -> "OutboxMessage":
+        """Build outbox row from mail message."""
+        return OutboxMessage(subject=msg.subject, sender=msg.sender, recipients=",".join(msg.recipients),
+                             body=msg.body, html=msg.html)
+
+    def to_message(self) -> Message:
+        """Build mail message from outbox row."""
+        return Message(self.subject, sender=self.sender, recipients=self.recipients.split(","),
+                       body=self.body, html=self.html)
+
+    @staticmethod
+    def claim(now: datetime, until: datetime, limit: int, max_attempts: int) -> list:
+        """Lease up to `limit` due messages till given time in one UPDATE.
+        Rows locked by other dispatchers are skipped on PostgreSQL, on SQLite
+        writes are serialized and the conditional UPDATE is enough."""
+        lease_id = secrets.token_hex(16)
+        due = select(OutboxMessage.message_id).where(
+            OutboxMessage.next_attempt_at <= now,
+            OutboxMessage.attempts < max_attempts
+        ).order_by(OutboxMessage.next_attempt_at).limit(limit).with_for_update(skip_locked=True)
+        db.session.execute(
+            update(OutboxMessage).where(
+                OutboxMessage.message_id.in_(due.scalar_subquery()),
+                OutboxMessage.next_attempt_at <= now
+            ).values(next_attempt_at=until, lease_id=lease_id).execution_options(synchronize_session=False)
         )
-        return checkout_session.url
+        return OutboxMessage.query.filter_by(lease_id=lease_id).order_by(OutboxMessage.message_id).all()
+
+    @staticmethod
+    def clean(before: datetime, max_attempts: int) -> int:
+        """Delete sent and given up messages created before given time."""
+        return db.session.execute(
+            delete(OutboxMessage).where(
+                OutboxMessage.created_at < before,
+                db.or_(OutboxMessage.sent_at.isnot(None), OutboxMessage.attempts >= max_attempts)
+            ).execution_options(synchronize_session=False)
+        ).rowcount
 
 
 class ProductCategory(Updateable, db.Model):
@@ -160,15 +585,36 @@ class ProductCategory(Updateable, db.Model):
 class Product(Updateable, db.Model):
     """SQLAlchemy model to represent 'products' table."""
     __tablename__ = "products"
+    __table_args__ = (
+        db.Index("ix_products_category_price", "category_id", "price", "product_id"),
+        db.Index("ix_products_category_name", "category_id", "name", "product_id"),
+    )
 
     product_id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), index=True, nullable=False)
     description = db.Column(db.Text)
     price = db.Column(db.Float, nullable=False)
     category_id = db.Column(db.Integer, db.ForeignKey("product_categories.category_id"))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     cart_items = db.relationship("CartItem", backref="product", cascade="all,delete", lazy="dynamic")
-    
+
+
+# Full-text search index of products, see api/search.py.
+PRODUCTS_FTS_SQLITE = "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts " \
+    "USING fts5(name, description, tokenize='porter unicode61')"
+PRODUCTS_FTS_POSTGRESQL = "CREATE INDEX IF NOT EXISTS ix_products_search ON products " \
+    "USING GIN (to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, '')))"
+
+# Name prefix index of category products for LIKE under any collation, see api/products.py.
+PRODUCTS_NAME_PATTERN_POSTGRESQL = "CREATE INDEX IF NOT EXISTS ix_products_category_name_pattern ON products " \
+    "(category_id, name text_pattern_ops)"
+
+event.listen(Product.__table__, "after_create", DDL(PRODUCTS_FTS_SQLITE).execute_if(dialect="sqlite"))
+event.listen(Product.__table__, "after_create", DDL(PRODUCTS_FTS_POSTGRESQL).execute_if(dialect="postgresql"))
+event.listen(Product.__table__, "after_create", DDL(PRODUCTS_NAME_PATTERN_POSTGRESQL).execute_if(dialect="postgresql"))
+event.listen(Product.__table__, "before_drop", DDL("DROP TABLE IF EXISTS products_fts").execute_if(dialect="sqlite"))
+
 
 class User(Updateable, db.Model):
     """SQLAlchemy model to represent 'users' table."""
@@ -181,6 +627,7 @@ class User(Updateable, db.Model):
     password_hash = db.Column(db.String(128))
     member_since = db.Column(db.DateTime, default=datetime.utcnow())
     last_seen = db.Column(db.DateTime, default=datetime.utcnow())
+    tokens_revoked_until = db.Column(db.DateTime)
 
     tokens = db.relationship("Token", backref="user", cascade="all,delete", lazy="dynamic")
     carts = db.relationship("Cart", backref="user", cascade="all,delete", lazy="dynamic")
@@ -191,47 +638,88 @@ class User(Updateable, db.Model):
 
     @password.setter 
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def ping(self):
         """Update user's last seen."""
         self.last_seen = datetime.utcnow()
 
     def verify_password(self, password):
-        """Verify user's password."""
-        return check_password_hash(self.password_hash, password)
+        """Verify user's password. Hash made with outdated parameters is upgraded on success."""
+        if not password_hasher.verify(self.password_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            self.password_hash = password_hasher.hash(password)
+        return True
 
     def generate_access_token(self):
         """Generate new access token."""
-        token = Token(user=self)
+        if self.user_id is None:
+            db.session.add(self)
+            db.session.flush()
+        token = Token(user_id=self.user_id)
         token.generate()
         return token
 
     def revoke_all(self):
         """Revoke all user tokens."""
-        self.tokens.delete()
+        token_store.revoke_user(self.user_id)
+        token_cache.invalidate_user(self.user_id)
+        revoked_tokens.revoke_user(self)
+
+    def snapshot(self):
+        """Detached copy of user columns which can be merged into any session without a query."""
+        user = User(**{column.key: getattr(self, column.key) for column in User.__table__.columns})
+        make_transient_to_detached(user)
+        return user
 
     @staticmethod
     def verify_access_token(access_token):
         """Verify access token."""
-        token = Token.query.filter_by(access_token=access_token).first()
+        user = token_cache.get(access_token)
+        if user is not None:
+            last_seen.touch(user)
+            return db.session.merge(user, load=False)
+
+        if current_app.config["SIGNED_ACCESS_TOKENS"]:
+            claims = load_access_token(access_token, current_app.config["SECRET_KEY"])
+            if claims:
+                user_id, expiration = claims
+                ttl = (expiration - timestamp_ms(datetime.utcnow())) / 1000
+                if ttl > 0:
+                    if revoked_tokens.is_revoked(access_token, user_id, expiration):
+                        return
+                    user = db.session.get(User, user_id)
+                    if user:
+                        last_seen.touch(user)
+                        token_cache.set(access_token, user.snapshot(), ttl=ttl)
+                        return user
+                return
+
+        token = token_store.get(access_token)
         if token:
             if token.access_expiration > datetime.utcnow():
-                token.user.ping()
-                db.session.commit()
-                return token.user
+                user = db.session.get(User, token.user_id)
+                if user is None:
+                    return
+                last_seen.touch(user)
+                ttl = (token.access_expiration - datetime.utcnow()).total_seconds()
+                token_cache.set(access_token, user.snapshot(), ttl=ttl)
+                return user
 
     @staticmethod
     def verify_refresh_token(refresh_token, access_token):
         """Verify refresh token."""
-        token = Token.query.filter_by(refresh_token=refresh_token, access_token=access_token).first()
+        token = token_store.get_refresh(refresh_token, access_token)
         if token:
             if token.refresh_expiration > datetime.utcnow():
                 return token
             
             # Revoke all tokens if someone try to use expired refresh token.
-            token.user.revoke_all()
-            db.session.commit()
+            user = db.session.get(User, token.user_id)
+            if user is not None:
+                user.revoke_all()
+                db.session.commit()
 
     def __repr__(self) -> str:
         return f"<User {self.username}>"
@@ -0,0 +1,145 @@
+from datetime import datetime, timedelta
+from time import monotonic
+
+import click
+from flask import Blueprint, current_app
+
+from . import mail
+from .email import send_mail
+from .models import db, Cart, OutboxMessage
+from .tasks import LEASE, PeriodicTask, retry_delay
+
+outbox = Blueprint("mail", __name__)
+
+# Seconds between outbox cleanups of background dispatcher.
+CLEAN_INTERVAL = 3600
+
+
+def send_batch(messages: list) -> int:
+    """Send leased messages over one SMTP connection and record the outcome
+    of each. Return number of sent messages."""
+    sent = done = 0
+    try:
+        with mail.connect() as connection:
+            for message in messages:
+                try:
+                    connection.send(message.to_message())
+                except Exception as e:
+                    current_app.logger.warning(f"Failed to send mail {message.message_id}: {e}")
+                    failed(message, e)
+                else:
+                    message.attempts += 1
+                    message.sent_at = datetime.utcnow()
+                    message.next_attempt_at = None
+                    sent += 1
+                done += 1
+    except Exception as e:
+        current_app.logger.exception("Failed to connect to mail server.")
+        for message in messages[done:]:
+            failed(message, e)
+    for message in messages:
+        message.lease_id = None
+    return sent
+
+
+def failed(message: OutboxMessage, error: Exception):
+    """Schedule message for another attempt."""
+    message.attempts += 1
+    message.last_error = f"{type(error).__name__}: {error}"
+    message.next_attempt_at = datetime.utcnow() + retry_delay(current_app.config["MAIL_RETRY_DELAY"], message.attempts)
+    if message.attempts >= current_app.config["MAIL_MAX_ATTEMPTS"]:
+        current_app.logger.error(f"Gave up sending mail {message.message_id} '{message.subject}' "
+                                 f"to {message.recipients} after {message.attempts} attempts: {message.last_error}")
+
+
+def dispatch_mail(batch_size: int=None) -> int:
+    """Send due outbox messages in batches until outbox is drained, failed
+    messages are retried with backoff up to MAIL_MAX_ATTEMPTS times. Return
+    number of sent messages."""
+    batch_size = batch_size or current_app.config["MAIL_BATCH_SIZE"]
+    sent = 0
+    while True:
+        now = datetime.utcnow()
+        messages = OutboxMessage.claim(now, now + LEASE, batch_size, current_app.config["MAIL_MAX_ATTEMPTS"])
+        db.session.commit()
+        if not messages:
+            return sent
+        sent += send_batch(messages)
+        db.session.commit()
+
+
+def clean_outbox() -> int:
+    """Delete sent and given up messages older than MAIL_OUTBOX_RETENTION_DAYS.
+    Return number of deleted messages."""
+    before = datetime.utcnow() - timedelta(days=current_app.config["MAIL_OUTBOX_RETENTION_DAYS"])
+    deleted = OutboxMessage.clean(before, current_app.config["MAIL_MAX_ATTEMPTS"])
+    db.session.commit()
+    return deleted
+
+
+_cleaned_at = monotonic()
+
+
+def run_dispatcher():
+    """Background dispatcher step, outbox is cleaned once per CLEAN_INTERVAL."""
+    global _cleaned_at
+    dispatch_mail()
+    if monotonic() - _cleaned_at > CLEAN_INTERVAL:
+        _cleaned_at = monotonic()
+        clean_outbox()
+
+
+dispatcher = PeriodicTask("mail-dispatcher", run_dispatcher, 0)
+
+
+@outbox.before_app_request
+def start_dispatcher():
+    """Start background mail dispatcher if outbox is enabled. It is started
+    by the first request, so CLI commands don't run it."""
+    interval = current_app.config["MAIL_DISPATCH_INTERVAL"]
+    if current_app.config["MAIL_OUTBOX"] and interval > 0:
+        dispatcher.interval = interval
+        dispatcher.start(current_app._get_current_object())
+
+
+def digest_window(now: datetime, hours: int) -> tuple:
+    """Window of given length ending at the last full hour, so digests run
+    by a scheduler a bit late neither overlap nor leave gaps."""
+    end = now.replace(minute=0, second=0, microsecond=0)
+    return end - timedelta(hours=hours), end
+
+
+def send_digest(hours: int=None) -> dict:
+    """Queue admin digest of carts paid in the last `hours` full hours.
+    Nothing is sent for a window without orders. Return digest."""
+    hours = hours or current_app.config["MAIL_DIGEST_HOURS"]
+    start, end = digest_window(datetime.utcnow(), hours)
+    digest = Cart.paid_digest(start, end, current_app.config["MAIL_DIGEST_TOP"])
+    if digest["orders"]:
+        send_mail(f"Purchases from {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M} UTC",
+                  current_app.config["ADMIN_EMAIL"], "admin/digest", digest=digest)
+        db.session.commit()
+    return digest
+
+
+@outbox.cli.command()
+@click.option("--hours", type=int, help="Length of summed up window, ending at the last full hour.")
+def digest(hours):
+    """Send admin digest of paid carts."""
+    digest = send_digest(hours)
+    print(f"Successfully summed up {digest['orders']} orders.")
+
+
+@outbox.cli.command()
+@click.option("--batch-size", type=int, help="Messages sent per SMTP connection.")
+def dispatch(batch_size):
+    """Send mail waiting in outbox."""
+    sent = dispatch_mail(batch_size)
+    print(f"Successfully sent {sent} messages.")
+
+
+@outbox.cli.command()
+def clean():
+    """Delete sent and given up outbox messages past retention."""
+    deleted = clean_outbox()
+    print(f"Successfully deleted {deleted} messages.")
@@ -0,0 +1,32 @@
+from stripe.api_requestor import APIRequestor
+from stripe.http_client import RequestsClient
+
+
+class StripeGateway:
+    """Stripe API calls made through one keep-alive HTTP client with explicit
+    timeouts. API key and base are passed per call instead of setting
+    `stripe` module globals."""
+    def __init__(self):
+        self.api_key = None
+        self.api_base = None
+        self.client = None
+
+    def init_app(self, app):
+        """Configure gateway from application config."""
+        self.api_key = app.config["STRIPE_SECRET_KEY"]
+        self.api_base = app.config["STRIPE_API_BASE"]
+        self.client = RequestsClient(timeout=(
+            app.config["STRIPE_CONNECT_TIMEOUT"], app.config["STRIPE_READ_TIMEOUT"]
+        ))
+
+    def request(self, method: str, url: str, params: dict=None, idempotency_key: str=None) -> dict:
+        """Make Stripe API request, return response data."""
+        requestor = APIRequestor(key=self.api_key, client=self.client, api_base=self.api_base)
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        response, _ = requestor.request(method, url, params, headers)
+        return response.data
+
+    def create_checkout_session(self, params: dict, idempotency_key: str) -> dict:
+        """Create Stripe Checkout Session. Requests with the same idempotency
+        key and params get the same session."""
+        return self.request("post", "/v1/checkout/sessions", params, idempotency_key)
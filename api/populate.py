@@ -2,6 +2,7 @@ import click
 from faker import Faker
 from flask import current_app, Blueprint
 
+from . import reference_data
 from .models import db, CartStatus, User
 
 fake = Faker()
@@ -15,6 +16,7 @@ def statuses():
         s = CartStatus(name=status)
         db.session.add(s)
     db.session.commit()
+    reference_data.reload()
     print(f"Successfully added to db {len(current_app.config['CART_STATUSES'])} statuses.")
 
 
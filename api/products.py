@@ -1,11 +1,18 @@
+from datetime import timezone
+
 from apiflask import abort, APIBlueprint
-from flask import current_app
+from flask import current_app, request, Response, stream_with_context
+from sqlalchemy import and_
 
+from . import response_cache, search
+from .catalog import EXPORTERS, import_products, READERS
 from .auth import token_auth
 from .decorators import admin_required
-from .models import db, Product, ProductCategory
-from .schemas import ProductSchema, ProductPaginationSchema, PaginationSchema
-from .utils import paginated_response
+from .models import db, Cart, Product, ProductCategory
+from .schemas import ProductSchema, ProductPaginationSchema, ProductListSchema, \
+    ProductSearchSchema, ProductSearchPaginationSchema, ProductImportSchema, \
+    ProductExportSchema, ProductIdsSchema, ProductBatchSchema, ProductBatchResultSchema
+from .utils import keyset_paginate, paginated_response
 
 products = APIBlueprint("products", __name__)
 
@@ -20,28 +27,140 @@ def new(data):
     """Create new product."""
     product = Product(**data)
     db.session.add(product)
+    db.session.flush()
+    search.index_product(product)
     db.session.commit()
+    response_cache.invalidate(f"category:{product.category_id}")
     return product
 
 
+def batch_response(ids: list) -> dict:
+    """Fetch products by ids with one query, keep order of ids and report missing ones."""
+    ids = list(dict.fromkeys(ids))
+    found = {product.product_id: product for product in Product.query.filter(Product.product_id.in_(ids))}
+    return {
+        "data": [found[product_id] for product_id in ids if product_id in found],
+        "missing": [product_id for product_id in ids if product_id not in found]
+    }
+
+
+@products.get("/products")
+@products.auth_required(token_auth)
+@products.input(ProductIdsSchema, location="query")
+@products.output(ProductBatchResultSchema)
+@products.doc(summary="Retrieve products by ids.", description="Retrieve up to 500 products by comma separated ids, e.g. `ids=1,2,3`. Products keep order of ids, ids of missing products are listed in `missing`. You need to be authenticated to access this resource.")
+def get_many(query):
+    """Retrieve products by ids."""
+    return batch_response(query["ids"])
+
+
+@products.post("/products/batch")
+@products.auth_required(token_auth)
+@products.input(ProductBatchSchema)
+@products.output(ProductBatchResultSchema)
+@products.doc(summary="Retrieve products by ids list.", description="Same as retrieving products by ids, but ids are passed in body, which suits long lists. You need to be authenticated to access this resource.")
+def batch(data):
+    """Retrieve products by ids list."""
+    return batch_response(data["ids"])
+
+
+@products.post("/products/bulk")
+@products.auth_required(token_auth)
+@admin_required
+@products.output(ProductImportSchema)
+@products.doc(summary="Import products.", description="Import products from request body streamed as CSV with header row (`text/csv`) or newline delimited JSON (`application/x-ndjson`). Each record has `name`, `description`, `price` and `category_id`. Invalid records are skipped and reported by row number. You need to be admin to access this resource.")
+def bulk():
+    """Import products."""
+    mimetype = request.mimetype
+    if mimetype == "text/csv":
+        records = READERS["csv"](request.stream)
+    elif mimetype in ("application/x-ndjson", "application/jsonl"):
+        records = READERS["ndjson"](request.stream)
+    else:
+        abort(415, "Send text/csv or application/x-ndjson.")
+    return import_products(records)
+
+
+@products.get("/products/export")
+@products.auth_required(token_auth)
+@admin_required
+@products.input(ProductExportSchema, location="query")
+@products.doc(summary="Export products.", description="Stream whole catalog ordered by product id as newline delimited JSON or CSV. Pass `updated_since` to get only products changed since given time. You need to be admin to access this resource.")
+def export(query):
+    """Export products."""
+    updated_since = query.get("updated_since")
+    if updated_since is not None and updated_since.tzinfo is not None:
+        updated_since = updated_since.astimezone(timezone.utc).replace(tzinfo=None)
+    exporter, mimetype = EXPORTERS[query["format"]]
+    return Response(stream_with_context(exporter(updated_since)), mimetype=mimetype)
+
+
+# Sort orders of category products, backed by (category_id, <column>, product_id) indexes.
+SORT_COLUMNS = {
+    "price": [Product.price, Product.product_id],
+    "-price": [Product.price, Product.product_id],
+    "name": [Product.name, Product.product_id]
+}
+
+
+def name_prefix(q: str):
+    """Case sensitive product name prefix filter which can use an index. On
+    SQLite LIKE ignores case, so a range is used, which holds for its BINARY
+    collation. Elsewhere U+10FFFF may not sort last, so LIKE is used, backed
+    by text_pattern_ops index on PostgreSQL."""
+    if db.engine.dialect.name == "sqlite":
+        return and_(Product.name >= q, Product.name < q + "\U0010ffff")
+    return Product.name.startswith(q, autoescape=True)
+
+
 @products.get("/category/<int:category_id>/products")
 @products.auth_required(token_auth)
-@products.input(PaginationSchema, location="query")
+@response_cache.cached(lambda category_id: f"category:{category_id}")
+@products.input(ProductListSchema, location="query")
 @products.output(ProductPaginationSchema)
-@products.doc(summary="Retrieve all products.", description="Retrieve all products. You need to be authenticated to access this resource.")
+@products.doc(summary="Retrieve all products.", description="Retrieve all products. Filter by `min_price`, `max_price` and case sensitive name prefix `q`, order by `sort` of `price`, `-price` or `name`. Pass `after` for cursor pagination. You need to be authenticated to access this resource.")
 def all(category_id, query):
     """Retrieve all products."""
     category = ProductCategory.query.filter_by(category_id=category_id).first() or abort(404, "Category not found.")
-    pagination = category.products.paginate(
-        page=query.get("page", 1),
-        per_page=query.get("per_page", current_app.config["PRODUCTS_PER_PAGE"])
-    )
+    per_page = query.get("per_page", current_app.config["PRODUCTS_PER_PAGE"])
+    products = category.products
+    if "min_price" in query:
+        products = products.filter(Product.price >= query["min_price"])
+    if "max_price" in query:
+        products = products.filter(Product.price <= query["max_price"])
+    if "q" in query:
+        products = products.filter(name_prefix(query["q"]))
+    columns = SORT_COLUMNS.get(query.get("sort"), [Product.product_id])
+    descending = query.get("sort") == "-price"
+
+    if "after" in query:
+        products, pagination = keyset_paginate(
+            products, columns, query["after"], per_page, query["with_total"], descending
+        )
+        return paginated_response(products, pagination)
+
+    products = products.order_by(*[column.desc() if descending else column for column in columns])
+    pagination = products.paginate(page=query.get("page", 1), per_page=per_page)
     products = pagination.items
     return paginated_response(products, pagination)
 
 
+@products.get("/products/search")
+@products.auth_required(token_auth)
+@products.input(ProductSearchSchema, location="query")
+@products.output(ProductSearchPaginationSchema)
+@products.doc(summary="Search products.", description="Search products by name and description, best matches first. Continue with `next_cursor` passed as `after`. You need to be authenticated to access this resource.")
+def search_products(query):
+    """Search products."""
+    products, pagination = search.search_products(
+        query["q"], query.get("after"), query.get("per_page", current_app.config["PRODUCTS_PER_PAGE"])
+    )
+    return paginated_response(products, pagination)
+
+
 @products.get("/products/<int:product_id>")
 @products.auth_required(token_auth)
+@response_cache.cached(lambda product_id: f"product:{product_id}")
 @products.output(ProductSchema)
 @products.doc(summary="Retieve product by id.", description="Retieve product by id. You need to be authenticated to access this resource.")
 def get(product_id):
@@ -58,8 +177,15 @@ def get(product_id):
 def put(product_id, data):
     """Edit product information."""
     product = Product.query.filter_by(product_id=product_id).first() or abort(404, "Product not found.")
+    category_id = product.category_id
+    price = product.price
     product.update(data)
+    search.index_product(product)
+    if product.price != price:
+        db.session.flush()
+        Cart.recalculate(Cart.open_with_products([product_id]))
     db.session.commit()
+    response_cache.invalidate(f"product:{product_id}", f"category:{category_id}", f"category:{product.category_id}")
     return product
 
 
@@ -71,6 +197,12 @@ def put(product_id, data):
 def delete(product_id):
     """Delete product."""
     product = Product.query.filter_by(product_id=product_id).first() or abort(404, "Product not found.")
+    category_id = product.category_id
+    cart_ids = Cart.open_with_products([product_id])
     db.session.delete(product)
+    search.unindex_products([product_id])
+    db.session.flush()
+    Cart.recalculate(cart_ids)
     db.session.commit()
+    response_cache.invalidate(f"product:{product_id}", f"category:{category_id}")
     return "", 204
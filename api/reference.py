@@ -0,0 +1,39 @@
+from threading import Lock
+
+
+class ReferenceData:
+    """Process-local cache of cart statuses.
+
+    Cart statuses are fixed by `flask populate statuses`, so their ids are
+    loaded once and reloaded only when unknown status is asked for.
+    """
+    def __init__(self):
+        self._statuses = None
+        self._lock = Lock()
+
+    def init_app(self, app):
+        """Drop cached rows of previous application."""
+        self.reload()
+
+    def reload(self):
+        """Drop cached rows, they are loaded again on next use."""
+        with self._lock:
+            self._statuses = None
+
+    def status_id(self, name: str) -> int:
+        """Id of cart status with given name."""
+        statuses = self._statuses
+        if statuses is None or name not in statuses:
+            statuses = self._load_statuses()
+        if name not in statuses:
+            raise RuntimeError(f"Cart status '{name}' doesn't exist, run 'flask populate statuses'.")
+        return statuses[name]
+
+    def _load_statuses(self) -> dict:
+        from . import db
+        from .models import CartStatus
+
+        statuses = dict(db.session.query(CartStatus.name, CartStatus.status_id))
+        with self._lock:
+            self._statuses = statuses
+        return statuses
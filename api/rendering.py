@@ -0,0 +1,25 @@
+from threading import Lock
+
+
+class TemplateCache:
+    """Jinja templates compiled once at startup. Templates are rendered
+    straight from compiled code with given context only, without request
+    context or database, so rendering is safe in any thread."""
+    def __init__(self, names=()):
+        self.names = tuple(names)
+        self.env = None
+        self._templates = {}
+        self._lock = Lock()
+
+    def init_app(self, app):
+        """Compile templates with application Jinja environment."""
+        self.env = app.jinja_env
+        self._templates = {name: self.env.get_template(name) for name in self.names}
+
+    def render(self, name: str, **context) -> str:
+        """Render template, one missing in the cache is compiled on first use."""
+        template = self._templates.get(name)
+        if template is None:
+            with self._lock:
+                template = self._templates[name] = self.env.get_template(name)
+        return template.render(**context)
@@ -1,16 +1,32 @@
 from apiflask import fields, Schema
-from apiflask.validators import Length, Regexp, Email, Range
-from marshmallow import validates, ValidationError
+from apiflask.validators import Length, Regexp, Email, Range, OneOf
+from marshmallow import validates, validates_schema, ValidationError
 
 from .auth import token_auth
 from .models import User, ProductCategory
 
 
 class PaginationSchema(Schema):
-    """Marshmallow schema to represent pagination. The schema is standard for whole application."""
+    """Marshmallow schema to represent pagination. The schema is standard for whole application.
+    
+    Pass `after` to switch from page numbers to cursor pagination, start with `after=0`
+    and continue with `next_cursor` of previous page. Total is counted in cursor mode
+    only with `with_total`."""
     page = fields.Integer(load_default=1)
-    per_page = fields.Integer()
-    total = fields.Integer(dump_only=True)
+    per_page = fields.Integer(validate=Range(min=1))
+    after = fields.String(load_only=True)
+    with_total = fields.Boolean(load_default=False, load_only=True)
+    total = fields.Integer(dump_only=True, allow_none=True)
+    next_cursor = fields.String(dump_only=True, allow_none=True)
+
+
+class ProductListSchema(PaginationSchema):
+    """Marshmallow schema to represent category products query. Filters and
+    sort work with both page numbers and cursor pagination."""
+    min_price = fields.Float(validate=Range(min=0.0))
+    max_price = fields.Float(validate=Range(min=0.0))
+    sort = fields.String(validate=OneOf(["price", "-price", "name"]))
+    q = fields.String(validate=Length(min=1, max=120))
 
 
 class UserSchema(Schema):
@@ -76,6 +92,7 @@ class ProductSchema(Schema):
     description = fields.String()
     price = fields.Float(reduired=True, validates=Range(min=0.0))
     category_id = fields.Integer(required=True)
+    updated_at = fields.DateTime(dump_only=True)
 
     @validates("category_id")
     def validate_category_id(self, value):
@@ -91,10 +108,83 @@ class ProductPaginationSchema(Schema):
     pagination = fields.Nested(PaginationSchema)
 
 
+class ProductIdsSchema(Schema):
+    """Marshmallow schema to represent product ids query, e.g. `ids=1,2,3`."""
+    ids = fields.DelimitedList(fields.Integer(), required=True, validate=Length(min=1, max=500))
+
+
+class ProductBatchSchema(Schema):
+    """Marshmallow schema to represent product ids body."""
+    ids = fields.List(fields.Integer(), required=True, validate=Length(min=1, max=500))
+
+
+class ProductBatchResultSchema(Schema):
+    """Marshmallow schema to represent products fetched by ids."""
+    data = fields.List(fields.Nested(ProductSchema))
+    missing = fields.List(fields.Integer())
+
+
+class ProductImportErrorSchema(Schema):
+    """Marshmallow schema to represent rejected row of products import."""
+    row = fields.Integer()
+    errors = fields.Dict()
+
+
+class ProductImportSchema(Schema):
+    """Marshmallow schema to represent products import report."""
+    imported = fields.Integer()
+    failed = fields.Integer()
+    errors = fields.List(fields.Nested(ProductImportErrorSchema))
+
+
+class ProductExportSchema(Schema):
+    """Marshmallow schema to represent products export query."""
+    format = fields.String(load_default="ndjson", validate=OneOf(["ndjson", "csv"]))
+    updated_since = fields.DateTime()
+
+
+class ProductSearchSchema(Schema):
+    """Marshmallow schema to represent product search query."""
+    q = fields.String(required=True, validate=Length(min=1, max=200))
+    after = fields.String()
+    per_page = fields.Integer(validate=Range(min=1))
+
+
+class ProductSearchResultSchema(ProductSchema):
+    """Marshmallow schema to represent product search result."""
+    score = fields.Float(dump_only=True)
+
+
+class ProductSearchPaginationSchema(Schema):
+    """Marshmallow schema to represent product search results pagination."""
+    data = fields.List(fields.Nested(ProductSearchResultSchema))
+    pagination = fields.Nested(PaginationSchema)
+
+
 class CartItem(Schema):
     """Marshmallow schema to represent Cart Item entity."""
     product = fields.Nested(ProductSchema)
     quantity = fields.Integer()
+    total = fields.Float(dump_only=True)
+
+
+class CartItemChangeSchema(Schema):
+    """Marshmallow schema to represent cart item change, either absolute
+    `quantity` or relative `delta`."""
+    product_id = fields.Integer(required=True)
+    quantity = fields.Integer(validate=Range(min=0))
+    delta = fields.Integer()
+
+    @validates_schema
+    def validate_change(self, data, **kwargs):
+        """Validate exactly one of quantity and delta is passed."""
+        if ("quantity" in data) == ("delta" in data):
+            raise ValidationError("Pass either quantity or delta.")
+
+
+class CartItemsChangeSchema(Schema):
+    """Marshmallow schema to represent cart items changes."""
+    items = fields.List(fields.Nested(CartItemChangeSchema), required=True, validate=Length(min=1, max=500))
 
 
 class StatusSchema(Schema):
@@ -107,6 +197,14 @@ class CartSchema(Schema):
     cart_id = fields.Integer(dump_only=True)
     items = fields.List(fields.Nested(CartItem))
     status = fields.Nested(StatusSchema)
+    item_count = fields.Integer(dump_only=True)
+    subtotal = fields.Float(dump_only=True)
+
+
+class CartPaginationSchema(Schema):
+    """Marshmallow schema to represent Cart pagination."""
+    data = fields.List(fields.Nested(CartSchema))
+    pagination = fields.Nested(PaginationSchema)
 
 
 class CheckoutSchema(Schema):
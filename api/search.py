@@ -0,0 +1,119 @@
+import re
+
+from sqlalchemy import bindparam, func, literal_column, select, text
+
+from . import db
+from .models import Product
+from .utils import keyset_paginate
+
+# Same expression as ix_products_search index, so PostgreSQL can use it.
+PG_VECTOR = "to_tsvector('english', coalesce(products.name, '') || ' ' || coalesce(products.description, ''))"
+
+
+def is_sqlite() -> bool:
+    """Check if FTS5 index table has to be maintained."""
+    return db.engine.dialect.name == "sqlite"
+
+
+def index_products(products: list):
+    """Add or replace products in full-text index. PostgreSQL index is
+    maintained by the database, so it's no-op there."""
+    if not is_sqlite() or not products:
+        return
+    unindex_products([product.product_id for product in products])
+    db.session.execute(
+        text("INSERT INTO products_fts (rowid, name, description) VALUES (:product_id, :name, :description)"),
+        [{"product_id": p.product_id, "name": p.name, "description": p.description} for p in products]
+    )
+
+
+def index_product(product: Product):
+    """Add or replace product in full-text index."""
+    index_products([product])
+
+
+def unindex_products(product_ids: list):
+    """Remove products from full-text index."""
+    if not is_sqlite() or not product_ids:
+        return
+    db.session.execute(
+        text("DELETE FROM products_fts WHERE rowid IN :ids").bindparams(bindparam("ids", expanding=True)),
+        {"ids": list(product_ids)}
+    )
+
+
+def index_products_after(product_id: int):
+    """Index all products with id greater than given one, used after bulk inserts."""
+    if is_sqlite():
+        db.session.execute(
+            text("INSERT INTO products_fts (rowid, name, description) "
+                 "SELECT product_id, name, description FROM products WHERE product_id > :product_id"),
+            {"product_id": product_id}
+        )
+
+
+def rebuild_index(batch_size: int) -> int:
+    """Rebuild full-text index of whole catalog, one transaction per batch.
+    Return number of indexed products."""
+    if not is_sqlite():
+        db.session.execute(text("REINDEX INDEX ix_products_search"))
+        db.session.commit()
+        return Product.query.count()
+
+    db.session.execute(text("DELETE FROM products_fts"))
+    db.session.commit()
+    indexed, last_id = 0, 0
+    while True:
+        rows = db.session.execute(
+            select(Product.product_id, Product.name, Product.description)
+            .where(Product.product_id > last_id)
+            .order_by(Product.product_id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return indexed
+        db.session.execute(
+            text("INSERT INTO products_fts (rowid, name, description) VALUES (:product_id, :name, :description)"),
+            [row._asdict() for row in rows]
+        )
+        db.session.commit()
+        indexed += len(rows)
+        last_id = rows[-1].product_id
+
+
+def match_expression(q: str) -> str:
+    """Turn user input into FTS5 query of prefix terms, all of them must match."""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", q))
+
+
+def search_products(q: str, after: str=None, per_page: int=10):
+    """Search products by name and description, best matches first.
+    Return products with `score` attribute set and pagination information."""
+    if is_sqlite():
+        expression = match_expression(q)
+        if not expression:
+            return [], {"per_page": per_page, "next_cursor": None, "total": None}
+        matches = select(
+            literal_column("rowid").label("product_id"),
+            (-func.bm25(literal_column("products_fts"))).label("score")
+        ).select_from(text("products_fts")) \
+            .where(text("products_fts MATCH :expression").bindparams(expression=expression)) \
+            .subquery()
+    else:
+        vector = literal_column(PG_VECTOR)
+        query = func.plainto_tsquery("english", q)
+        matches = select(
+            Product.product_id.label("product_id"),
+            func.ts_rank(vector, query).label("score")
+        ).where(vector.op("@@")(query)).subquery()
+
+    rows = db.session.query(Product, matches.c.score, matches.c.product_id) \
+        .join(matches, Product.product_id == matches.c.product_id)
+    rows, pagination = keyset_paginate(
+        rows, [matches.c.score, matches.c.product_id], after, per_page, descending=True
+    )
+    products = []
+    for product, score, _ in rows:
+        product.score = score
+        products.append(product)
+    return products, pagination
@@ -0,0 +1,117 @@
+import base64
+import hashlib
+import hmac
+import secrets
+from calendar import timegm
+from datetime import datetime, timedelta
+from threading import Lock
+from time import monotonic
+
+
+def timestamp_ms(value: datetime) -> int:
+    """Convert naive UTC datetime to milliseconds since epoch."""
+    return timegm(value.utctimetuple()) * 1000 + value.microsecond // 1000
+
+
+def _signature(body: str, key: str) -> str:
+    """Truncated HMAC-SHA256 of token body."""
+    digest = hmac.new(key.encode(), b"access-token:" + body.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:16]).rstrip(b"=").decode()
+
+
+def sign_access_token(user_id: int, expiration: datetime, key: str) -> str:
+    """Create signed access token '<user_id>.<expiration_ms>.<nonce>.<signature>'."""
+    body = f"{user_id:x}.{timestamp_ms(expiration):x}.{secrets.token_urlsafe(6)}"
+    return f"{body}.{_signature(body, key)}"
+
+
+def load_access_token(token: str, key: str):
+    """Return (user_id, expiration_ms) of signed access token or None if
+    token is not signed or signature doesn't match."""
+    parts = token.split(".")
+    if len(parts) != 4:
+        return None
+    body = ".".join(parts[:3])
+    if not hmac.compare_digest(parts[3], _signature(body, key)):
+        return None
+    try:
+        return int(parts[0], 16), int(parts[1], 16)
+    except ValueError:
+        return None
+
+
+class RevocationList:
+    """Revocation check of signed access tokens, shared by all workers
+    through the database and checked in memory.
+
+    Revoked tokens are stored by signature in 'revoked_tokens' table till
+    they expire, users revoked with `revoke_user` get a cutoff covering every
+    token issued to them so far. Each worker keeps unexpired revocations in
+    memory and reloads them from the database every
+    REVOCATION_SYNC_INTERVAL seconds, so verification doesn't query them.
+    """
+    def __init__(self):
+        self._signatures = {}
+        self._cutoffs = {}
+        self._synced_at = None
+        self._lock = Lock()
+
+    def init_app(self, app):
+        """Configure revocation list from application config."""
+        if app.config["SIGNED_ACCESS_TOKENS"] and not app.config["SECRET_KEY"]:
+            raise RuntimeError("SECRET_KEY is required for signed access tokens.")
+        self.key = app.config["SECRET_KEY"]
+        self.lifetime = timedelta(minutes=app.config["ACCESS_EXPIRATION_IN_MINUTES"])
+        self.sync_interval = app.config["REVOCATION_SYNC_INTERVAL"]
+        with self._lock:
+            self._signatures, self._cutoffs, self._synced_at = {}, {}, None
+
+    def revoke(self, token: str):
+        """Revoke single signed access token."""
+        from .models import RevokedToken
+
+        claims = load_access_token(token, self.key)
+        if claims is None:
+            return
+        signature = token.rsplit(".", 1)[1]
+        RevokedToken.add(signature, datetime.utcfromtimestamp(claims[1] / 1000))
+        with self._lock:
+            self._signatures[signature] = claims[1]
+
+    def revoke_user(self, user):
+        """Revoke all signed access tokens issued to user so far."""
+        user.tokens_revoked_until = datetime.utcnow() + self.lifetime
+        with self._lock:
+            self._cutoffs[user.user_id] = timestamp_ms(user.tokens_revoked_until)
+
+    def is_revoked(self, token: str, user_id: int, expiration: int) -> bool:
+        """Check if signed access token was revoked. Tokens expiring exactly
+        at the cutoff were issued right after revoking and stay valid."""
+        if self._synced_at is None or monotonic() - self._synced_at >= self.sync_interval:
+            self.sync()
+        if expiration < self._cutoffs.get(user_id, 0):
+            return True
+        return token.rsplit(".", 1)[1] in self._signatures
+
+    def sync(self):
+        """Reload unexpired revocations from the database."""
+        from . import db
+        from .models import RevokedToken, User
+
+        now = datetime.utcnow()
+        signatures = {
+            signature: timestamp_ms(expiration) for signature, expiration in
+            db.session.query(RevokedToken.signature, RevokedToken.expiration).filter(RevokedToken.expiration > now)
+        }
+        cutoffs = {
+            user_id: timestamp_ms(until) for user_id, until in
+            db.session.query(User.user_id, User.tokens_revoked_until).filter(User.tokens_revoked_until > now)
+        }
+        with self._lock:
+            self._signatures, self._cutoffs, self._synced_at = signatures, cutoffs, monotonic()
+
+    def clean(self) -> int:
+        """Delete revoked tokens which expired anyway."""
+        from .models import RevokedToken
+
+        return RevokedToken.clean(datetime.utcnow())
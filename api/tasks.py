@@ -0,0 +1,46 @@
+from datetime import timedelta
+from threading import Event, Thread
+
+# Time a worker has to process leased rows before others may take them.
+LEASE = timedelta(minutes=5)
+MAX_RETRY_DELAY = 3600
+
+
+def retry_delay(base_delay: float, attempts: int) -> timedelta:
+    """Exponential backoff after given number of failed attempts."""
+    delay = base_delay * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, MAX_RETRY_DELAY))
+
+
+class PeriodicTask:
+    """Run function inside application context every `interval` seconds
+    in a background daemon thread."""
+    def __init__(self, name: str, func, interval: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self._stop = Event()
+        self._thread = None
+
+    def start(self, app):
+        """Start background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, args=[app], name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float=None):
+        """Stop background thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self, app):
+        """Background loop."""
+        while not self._stop.wait(self.interval):
+            with app.app_context():
+                try:
+                    self.func()
+                except Exception:
+                    app.logger.exception(f"Periodic task {self.name} failed.")
@@ -0,0 +1,215 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from multiprocessing.managers import BaseManager
+from threading import Lock
+from time import monotonic
+
+from . import db
+
+TOKEN_FIELDS = ("access_token", "access_expiration", "refresh_token", "refresh_expiration", "user_id")
+
+
+class TokenStore(ABC):
+    """Interface of access and refresh tokens persistence."""
+    @abstractmethod
+    def save(self, token):
+        """Persist new or modified token."""
+
+    @abstractmethod
+    def get(self, access_token: str):
+        """Return token by access token or None."""
+
+    @abstractmethod
+    def get_refresh(self, refresh_token: str, access_token: str):
+        """Return token by refresh and access token pair or None."""
+
+    @abstractmethod
+    def revoke_user(self, user_id: int):
+        """Delete all tokens of user."""
+
+    @abstractmethod
+    def clean(self, batch_size: int) -> int:
+        """Delete tokens that expired more than yesterday, return number of deleted tokens."""
+
+
+class SQLAlchemyTokenStore(TokenStore):
+    """Tokens kept in 'tokens' table."""
+    def save(self, token):
+        db.session.add(token)
+
+    def get(self, access_token: str):
+        from .models import Token
+        return Token.query.filter_by(access_token=access_token).first()
+
+    def get_refresh(self, refresh_token: str, access_token: str):
+        from .models import Token
+        return Token.query.filter_by(refresh_token=refresh_token, access_token=access_token).first()
+
+    def revoke_user(self, user_id: int):
+        from .models import Token
+        Token.query.filter_by(user_id=user_id).delete()
+
+    def clean(self, batch_size: int) -> int:
+        """Delete expired tokens in batches, each batch in its own transaction."""
+        from .models import Token
+        yesterday = datetime.utcnow() - timedelta(days=1)
+        deleted = 0
+        while True:
+            ids = [token_id for token_id, in db.session.query(Token.token_id)
+                   .filter(Token.refresh_expiration < yesterday)
+                   .limit(batch_size)]
+            if ids:
+                Token.query.filter(Token.token_id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            deleted += len(ids)
+            if len(ids) < batch_size:
+                return deleted
+
+
+class TokenTable:
+    """Thread-safe table of token records, a record is dropped one day after
+    its refresh token expires."""
+    def __init__(self):
+        self._tokens = {}
+        self._refresh = {}
+        self._cleaned_at = monotonic()
+        self._lock = Lock()
+
+    def put(self, record: dict):
+        """Insert or replace token record."""
+        with self._lock:
+            self._tokens[record["access_token"]] = record
+            self._refresh[record["refresh_token"]] = record["access_token"]
+        if monotonic() - self._cleaned_at > 60:
+            self.clean()
+
+    def get(self, access_token: str):
+        """Return token record by access token."""
+        with self._lock:
+            return self._tokens.get(access_token)
+
+    def get_refresh(self, refresh_token: str, access_token: str):
+        """Return token record by refresh and access token pair."""
+        with self._lock:
+            if self._refresh.get(refresh_token) == access_token:
+                return self._tokens.get(access_token)
+
+    def delete_user(self, user_id: int) -> int:
+        """Delete all token records of user."""
+        with self._lock:
+            return self._delete(lambda record: record["user_id"] == user_id)
+
+    def clean(self) -> int:
+        """Delete token records that expired more than yesterday."""
+        yesterday = datetime.utcnow() - timedelta(days=1)
+        with self._lock:
+            self._cleaned_at = monotonic()
+            return self._delete(lambda record: record["refresh_expiration"] < yesterday)
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def _delete(self, predicate) -> int:
+        """Delete records matching predicate, caller holds the lock."""
+        records = [record for record in self._tokens.values() if predicate(record)]
+        for record in records:
+            del self._tokens[record["access_token"]]
+            self._refresh.pop(record["refresh_token"], None)
+        return len(records)
+
+
+class MemoryTokenStore(TokenStore):
+    """Tokens kept in process memory.
+
+    Returned tokens are transient `Token` instances, they are never added
+    to database session and have only `user_id` set, not `user`.
+    """
+    def __init__(self):
+        self._table = TokenTable()
+
+    @property
+    def table(self):
+        return self._table
+
+    def save(self, token):
+        self.table.put({field: getattr(token, field) for field in TOKEN_FIELDS})
+
+    def get(self, access_token: str):
+        return self._token(self.table.get(access_token))
+
+    def get_refresh(self, refresh_token: str, access_token: str):
+        return self._token(self.table.get_refresh(refresh_token, access_token))
+
+    def revoke_user(self, user_id: int):
+        self.table.delete_user(user_id)
+
+    def clean(self, batch_size: int) -> int:
+        return self.table.clean()
+
+    @staticmethod
+    def _token(record):
+        """Make transient token from record."""
+        from .models import Token
+        if record is not None:
+            return Token(**record)
+
+
+class TokenTableManager(BaseManager):
+    """Manager which shares one `TokenTable` between processes."""
+
+
+TokenTableManager.register("get_table")
+
+
+class SharedTokenStore(MemoryTokenStore):
+    """Tokens kept in memory of a separate `flask tokens serve` process and
+    shared by all application workers over a local socket."""
+    def __init__(self, address, authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._table = None
+        self._lock = Lock()
+
+    @property
+    def table(self):
+        """Proxy of shared table, connected on first use."""
+        with self._lock:
+            if self._table is None:
+                manager = TokenTableManager(address=self.address, authkey=self.authkey)
+                manager.connect()
+                self._table = manager.get_table()
+            return self._table
+
+
+def parse_address(address: str):
+    """Parse 'host:port' into tuple, anything else is unix socket path."""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def serve_token_table(address, authkey: bytes):
+    """Serve shared token table until interrupted."""
+    table = TokenTable()
+
+    class Server(BaseManager):
+        pass
+
+    Server.register("get_table", callable=lambda: table)
+    Server(address=address, authkey=authkey).get_server().serve_forever()
+
+
+def create_token_store(app) -> TokenStore:
+    """Create token store selected by TOKEN_STORE config."""
+    backend = app.config["TOKEN_STORE"]
+    if backend == "sqlalchemy":
+        return SQLAlchemyTokenStore()
+    if backend == "memory":
+        return MemoryTokenStore()
+    if backend == "shared":
+        return SharedTokenStore(
+            parse_address(app.config["TOKEN_STORE_ADDRESS"]),
+            app.config["SECRET_KEY"].encode()
+        )
+    raise RuntimeError(f"Unknown token store '{backend}'.")
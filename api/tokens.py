@@ -1,12 +1,43 @@
+import click
 from apiflask import abort, APIBlueprint
 from flask import current_app, url_for, request
 from werkzeug.http import dump_cookie
 
+from . import token_store
 from .auth import basic_auth, token_auth
 from .models import db, Token, User
 from .schemas import TokenSchema
+from .tasks import PeriodicTask
+from .token_stores import parse_address, serve_token_table
 
-tokens = APIBlueprint("tokens", __name__)
+tokens = APIBlueprint("tokens", __name__, cli_group="tokens")
+sweeper = PeriodicTask("tokens-sweeper", Token.clean, 0)
+
+
+@tokens.before_app_request
+def start_sweeper():
+    """Start background expired tokens sweeper if enabled. It is started by
+    the first request, so CLI commands don't run it."""
+    interval = current_app.config["TOKENS_SWEEP_INTERVAL"]
+    if interval > 0:
+        sweeper.interval = interval
+        sweeper.start(current_app._get_current_object())
+
+
+@tokens.cli.command()
+@click.option("--batch-size", type=int, help="Tokens deleted per transaction.")
+def sweep(batch_size):
+    """Delete expired tokens."""
+    deleted = Token.clean(batch_size)
+    print(f"Successfully deleted {deleted} expired tokens.")
+
+
+@tokens.cli.command()
+def serve():
+    """Serve shared in-memory token store for TOKEN_STORE=shared."""
+    address = current_app.config["TOKEN_STORE_ADDRESS"]
+    print(f"Serving token store at {address}.")
+    serve_token_table(parse_address(address), current_app.config["SECRET_KEY"].encode())
 
 
 def token_response(token: Token):
@@ -37,8 +68,7 @@ def new():
     """Create access token."""
     user = basic_auth.current_user
     token = user.generate_access_token()
-    db.session.add(token)
-    Token.clean()
+    token_store.save(token)
     db.session.commit()
     return token_response(token)
 
@@ -56,9 +86,10 @@ def put(data):
     token = User.verify_refresh_token(refresh_token, access_token) 
     if not token:
         abort(401)
+    user = db.session.get(User, token.user_id) or abort(401)
     token.expire()
-    new_token = token.user.generate_access_token()
-    db.session.add(new_token)
+    new_token = user.generate_access_token()
+    token_store.save(new_token)
     db.session.commit()
     return token_response(new_token)
 
@@ -72,7 +103,7 @@ def delete():
     access_token = request.headers["Authorization"].split()[1]
     if not access_token:
         abort(400, "Provide access token.")
-    token = Token.query.filter_by(access_token=access_token).first()
+    token = token_store.get(access_token)
     if not token:
         abort(400, "Invalid token.")
     token.expire()
@@ -1,12 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import click
 from apiflask import abort, APIBlueprint
 from flask import current_app
-
+from . import password_hasher, token_cache
 from .auth import token_auth
+from .hashing import HasherBusy, normalize_method, PasswordHasher
 from .schemas import UserSchema, UserPaginationSchema, PaginationSchema
 from .models import db, User
-from .utils import paginated_response
+from .utils import keyset_paginate, paginated_response
+
+users = APIBlueprint("users", __name__, cli_group="users")
 
-users = APIBlueprint("users", __name__)
+
+@users.cli.command("benchmark-hash")
+@click.option("--method", "methods", multiple=True, help="Hash method to measure, can be repeated.")
+@click.option("--rounds", type=int, default=20, help="Hashes computed for each method.")
+def benchmark_hash(methods, rounds):
+    """Report password hashes per second for each hash cost, measured
+    through the configured hashing pool."""
+    methods = methods or [
+        "pbkdf2:sha256:100000",
+        "pbkdf2:sha256:260000",
+        "pbkdf2:sha256:600000",
+        password_hasher.method
+    ]
+    hasher = PasswordHasher()
+    hasher.init_app(current_app)
+    try:
+        with ThreadPoolExecutor(max(hasher.workers, 1)) as executor:
+            for method in dict.fromkeys(methods):
+                hasher.method = normalize_method(method)
+                # start worker processes before measuring
+                list(executor.map(hasher.hash, ["warmup"] * max(hasher.workers, 1)))
+                start = perf_counter()
+                list(executor.map(hasher.hash, ["benchmark"] * rounds))
+                elapsed = perf_counter() - start
+                print(f"{method}: {rounds / elapsed:.1f} hashes/sec")
+    finally:
+        hasher.shutdown()
 
 
 @users.post("/users")
@@ -15,7 +48,10 @@ users = APIBlueprint("users", __name__)
 @users.doc(summary="Create new user.", description="Create new user. To create new user you have to specify all required fields.")
 def new(data):
     """Create new user."""
-    user = User(**data)
+    try:
+        user = User(**data)
+    except HasherBusy:
+        abort(503, "Server is busy, try again later.")
     db.session.add(user)
     db.session.commit()
     return user
@@ -34,13 +70,17 @@ def get_by_username(username):
 @users.auth_required(token_auth)
 @users.input(PaginationSchema, location="query")
 @users.output(UserPaginationSchema)
-@users.doc(summary="Retrieve all users.", description="Retrieve all users. ")
+@users.doc(summary="Retrieve all users.", description="Retrieve all users. Pass `after` for cursor pagination.")
 def all(query):
     """Retrieve all users."""
-    pagination = User.query.paginate(
-        page=query.get("page", 1),
-        per_page=query.get("per_page", current_app.config["USERS_PER_PAGE"])
-    )
+    per_page = query.get("per_page", current_app.config["USERS_PER_PAGE"])
+    if "after" in query:
+        users, pagination = keyset_paginate(
+            User.query, [User.user_id], query["after"], per_page, query["with_total"]
+        )
+        return paginated_response(users, pagination)
+
+    pagination = User.query.paginate(page=query.get("page", 1), per_page=per_page)
     users = pagination.items
     return paginated_response(users, pagination)
 
@@ -62,6 +102,10 @@ def me():
 def put(data):
     """Edit user information."""
     user = token_auth.current_user
-    user.update(data)
+    try:
+        user.update(data)
+    except HasherBusy:
+        abort(503, "Server is busy, try again later.")
     db.session.commit()
+    token_cache.invalidate_user(user.user_id)
     return user
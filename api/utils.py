@@ -1,3 +1,11 @@
+import base64
+import binascii
+import json
+
+from apiflask import abort
+from sqlalchemy import and_, false, or_, tuple_
+
+
 def paginated_response(data, pagination, status_code=200, headers=None):
     """Prepare response for pagination schema."""
     return {
@@ -11,3 +19,87 @@ def checkout_response(url: str):
     return {
         "url": url
     }
+
+
+def encode_cursor(values: list) -> str:
+    """Encode keyset cursor. Single integer key is kept readable, e.g. '42'."""
+    if len(values) == 1 and isinstance(values[0], int):
+        return str(values[0])
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """Decode keyset cursor made by `encode_cursor`."""
+    try:
+        if cursor.lstrip("-").isdigit():
+            values = [int(cursor)]
+        else:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        abort(400, "Invalid cursor.")
+    if not isinstance(values, list) or len(values) != size:
+        abort(400, "Invalid cursor.")
+    return values
+
+
+def _nullable(column) -> bool:
+    """Check if column is a table column that allows NULL."""
+    return getattr(getattr(column, "expression", column), "nullable", False)
+
+
+def _seek_nullable(columns: list, values: list, descending: bool):
+    """Build filter of rows past the cursor when some columns allow NULL.
+    Row value comparison drops rows with NULL, so compare column by column,
+    with NULLs ordered first ascending and last descending."""
+    clauses, equal = [], []
+    for column, value in zip(columns, values):
+        if value is None:
+            after = false() if descending else column.isnot(None)
+            equal.append(column.is_(None))
+        else:
+            after = column < value if descending else column > value
+            if descending and _nullable(column):
+                after = or_(after, column.is_(None))
+            equal.append(column == value)
+        clauses.append(and_(*equal[:-1], after))
+    return or_(*clauses)
+
+
+def keyset_paginate(query, columns: list, after: str=None, per_page: int=10,
+                    with_total: bool=False, descending: bool=False):
+    """Paginate query by seeking past the cursor on unique ordered columns
+    instead of OFFSET. Return page items and pagination information.
+
+    :param query: query to paginate.
+    :param columns: columns to order by, the last one must be unique
+        and not null. NULLs are ordered first, or last when descending.
+    :param after: cursor returned as `next_cursor` of previous page.
+    :param per_page: number of items per page.
+    :param with_total: count all query rows.
+    :param descending: order columns descending.
+    """
+    total = query.order_by(None).count() if with_total else None
+    # '0' starts from the beginning for composite keys too
+    if after and not (after == "0" and len(columns) > 1):
+        values = decode_cursor(after, len(columns))
+        if any(_nullable(column) for column in columns):
+            query = query.filter(_seek_nullable(columns, values, descending))
+        else:
+            key, cursor = (columns[0], values[0]) if len(columns) == 1 else (tuple_(*columns), tuple_(*values))
+            query = query.filter(key < cursor if descending else key > cursor)
+    order = [column.desc() if descending else column for column in columns]
+    order = [
+        (clause.nulls_last() if descending else clause.nulls_first()) if _nullable(column) else clause
+        for column, clause in zip(columns, order)
+    ]
+    items = query.order_by(None).order_by(*order).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor([getattr(items[-1], column.key) for column in columns])
+    return items, {
+        "per_page": per_page,
+        "next_cursor": next_cursor,
+        "total": total
+    }
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -23,17 +24,55 @@ class Config:
         "sqlite:///" + os.path.join(base_dir, "db.sqlite")
 
     # Pagination.
-    USERS_PER_PAGE = os.environ.get("USERS_PER_PAGE") or 10
-    PRODUCTS_PER_PAGE = os.environ.get("PRODUCTS_PER_PAGE") or 10
+    USERS_PER_PAGE = int(os.environ.get("USERS_PER_PAGE") or "10")
+    PRODUCTS_PER_PAGE = int(os.environ.get("PRODUCTS_PER_PAGE") or "10")
+    CARTS_PER_PAGE = int(os.environ.get("CARTS_PER_PAGE") or "10")
+
+    # Catalog responses cache: "memory", "file" (shared by workers) or "none".
+    RESPONSE_CACHE = os.environ.get("RESPONSE_CACHE") or "memory"
+    RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE") or "1024")
+    RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL") or "300")
+    RESPONSE_CACHE_DIR = os.environ.get("RESPONSE_CACHE_DIR") or \
+        os.path.join(tempfile.gettempdir(), f"shop-api-cache-{os.geteuid()}")
 
     # OAuth 2.0
     REFRESH_EXPIRATION_IN_DAYS = int(os.environ.get("REFRESH_EXPIRATION_IN_DAYS") or "7")
     ACCESS_EXPIRATION_IN_MINUTES = int(os.environ.get("ACCESS_EXPIRATION_IN_MINUTES") or "15")
     REFRESH_TOKEN_IN_COOKIE = as_bool(os.environ.get("REFRESH_TOKEN_IN_COOKIE", "yes"))
     REFRESH_TOKEN_IN_BODY = as_bool(os.environ.get("REFRESH_TOKEN_IN_BODY"))
+    # Issue access tokens signed with SECRET_KEY which are verified without database lookup.
+    SIGNED_ACCESS_TOKENS = as_bool(os.environ.get("SIGNED_ACCESS_TOKENS"))
+    # Seconds between reloads of revoked signed tokens by each worker.
+    REVOCATION_SYNC_INTERVAL = int(os.environ.get("REVOCATION_SYNC_INTERVAL") or "10")
+    # Token store: "sqlalchemy", "memory" or "shared" (served by `flask tokens serve`).
+    TOKEN_STORE = os.environ.get("TOKEN_STORE") or "sqlalchemy"
+    TOKEN_STORE_ADDRESS = os.environ.get("TOKEN_STORE_ADDRESS") or os.path.join(base_dir, "tokens.sock")
+
+    # Expired tokens sweeper. Set interval to 0 to sweep only with `flask tokens sweep`.
+    TOKENS_SWEEP_INTERVAL = int(os.environ.get("TOKENS_SWEEP_INTERVAL") or "0")
+    TOKENS_SWEEP_BATCH_SIZE = int(os.environ.get("TOKENS_SWEEP_BATCH_SIZE") or "5000")
+
+    # Verified access tokens cache. Set size to 0 to disable.
+    TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE") or "10000")
+    TOKEN_CACHE_TTL = int(os.environ.get("TOKEN_CACHE_TTL") or "60")
+
+    # Users last seen write-behind buffer.
+    LAST_SEEN_GRANULARITY = int(os.environ.get("LAST_SEEN_GRANULARITY") or "60")
+    LAST_SEEN_FLUSH_INTERVAL = int(os.environ.get("LAST_SEEN_FLUSH_INTERVAL") or "30")
+    LAST_SEEN_BUFFER_SIZE = int(os.environ.get("LAST_SEEN_BUFFER_SIZE") or "1000")
+
+    # Password hashing. Workers is the size of hashing process pool, 0 hashes inline.
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD") or "pbkdf2:sha256:260000"
+    PASSWORD_SALT_LENGTH = int(os.environ.get("PASSWORD_SALT_LENGTH") or "16")
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS") or "2")
+    PASSWORD_HASH_TIMEOUT = int(os.environ.get("PASSWORD_HASH_TIMEOUT") or "5")
 
     # Administration config
     ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL")
+    # Mail admin on every paid cart, otherwise use `flask mail digest`.
+    ADMIN_ORDER_MAIL = as_bool(os.environ.get("ADMIN_ORDER_MAIL", "no"))
+    MAIL_DIGEST_HOURS = int(os.environ.get("MAIL_DIGEST_HOURS") or "24")
+    MAIL_DIGEST_TOP = int(os.environ.get("MAIL_DIGEST_TOP") or "10")
 
     # Checkout statuses
     CART_STATUSES = ["paid", "ready to pay", "failed"]
@@ -43,6 +82,17 @@ class Config:
     CHECKOUT_FAIL = os.environ.get("CHECKOUT_FAIL") or "http://localhost:3000/fail"
     STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY")
     STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET")
+    STRIPE_API_BASE = os.environ.get("STRIPE_API_BASE") or "https://api.stripe.com"
+    STRIPE_CONNECT_TIMEOUT = float(os.environ.get("STRIPE_CONNECT_TIMEOUT") or "3")
+    STRIPE_READ_TIMEOUT = float(os.environ.get("STRIPE_READ_TIMEOUT") or "10")
+    # Seconds checkout session is reused for unchanged cart, from 1800 to 43200.
+    CHECKOUT_SESSION_TTL = int(os.environ.get("CHECKOUT_SESSION_TTL") or "3600")
+
+    # Stripe webhook events inbox worker, 0 interval leaves it to `flask events process`.
+    EVENTS_PROCESS_INTERVAL = int(os.environ.get("EVENTS_PROCESS_INTERVAL") or "5")
+    EVENTS_BATCH_SIZE = int(os.environ.get("EVENTS_BATCH_SIZE") or "100")
+    EVENTS_MAX_ATTEMPTS = int(os.environ.get("EVENTS_MAX_ATTEMPTS") or "8")
+    EVENTS_RETRY_DELAY = int(os.environ.get("EVENTS_RETRY_DELAY") or "30")
 
     # Mail config
     MAIL_USERNAME = os.environ.get("MAIL_USERNAME")
@@ -50,6 +100,18 @@ class Config:
     MAIL_SERVER = os.environ.get("MAIL_SERVER") or "smtp.googlemail.com"
     MAIL_PORT = os.environ.get("MAIL_PORT") or 587
     MAIL_USE_TLS = as_bool(os.environ.get("MAIL_USE_TLS", "yes"))
+    # Mail sending threads, 0 sends on the calling thread.
+    MAIL_WORKERS = int(os.environ.get("MAIL_WORKERS") or "2")
+    MAIL_QUEUE_SIZE = int(os.environ.get("MAIL_QUEUE_SIZE") or "1000")
+    MAIL_QUEUE_TIMEOUT = int(os.environ.get("MAIL_QUEUE_TIMEOUT") or "5")
+    MAIL_KEEPALIVE = int(os.environ.get("MAIL_KEEPALIVE") or "10")
+    # Mail outbox dispatcher, 0 interval leaves it to `flask mail dispatch`.
+    MAIL_OUTBOX = as_bool(os.environ.get("MAIL_OUTBOX", "no"))
+    MAIL_DISPATCH_INTERVAL = int(os.environ.get("MAIL_DISPATCH_INTERVAL") or "5")
+    MAIL_BATCH_SIZE = int(os.environ.get("MAIL_BATCH_SIZE") or "50")
+    MAIL_MAX_ATTEMPTS = int(os.environ.get("MAIL_MAX_ATTEMPTS") or "8")
+    MAIL_RETRY_DELAY = int(os.environ.get("MAIL_RETRY_DELAY") or "60")
+    MAIL_OUTBOX_RETENTION_DAYS = int(os.environ.get("MAIL_OUTBOX_RETENTION_DAYS") or "7")
 
     # Cross origin resource sharing
     USE_CORS = as_bool(os.environ.get("USE_CORS", "yes"))
@@ -67,6 +129,53 @@ class TestConfig:
     SQLALCHEMY_DATABASE_URI = os.environ.get("TEST_DATABASE_URL") or \
         "sqlite:///" + os.path.join(base_dir, "test_db.sqlite")
 
+    # Administration config
+    ADMIN_EMAIL = "admin@example.com"
+    ADMIN_ORDER_MAIL = True
+    MAIL_DIGEST_HOURS = 24
+    MAIL_DIGEST_TOP = 3
+
+    # Checkout statuses
+    CART_STATUSES = ["paid", "ready to pay", "failed"]
+
+    # Stripe checkout.
+    STRIPE_SECRET_KEY = "sk_test_key"
+    STRIPE_WEBHOOK_SECRET = "whsec_test_secret"
+    STRIPE_API_BASE = "http://127.0.0.1:9"
+    STRIPE_CONNECT_TIMEOUT = 1
+    STRIPE_READ_TIMEOUT = 2
+    CHECKOUT_SESSION_TTL = 3600
+    CHECKOUT_SUCCESS = "http://localhost:3000/success"
+    CHECKOUT_FAIL = "http://localhost:3000/fail"
+    EVENTS_PROCESS_INTERVAL = 0
+    EVENTS_BATCH_SIZE = 2
+    EVENTS_MAX_ATTEMPTS = 3
+    EVENTS_RETRY_DELAY = 0
+
+    # Mail is not sent in testing mode.
+    MAIL_USERNAME = "shop@example.com"
+    MAIL_WORKERS = 0
+    MAIL_QUEUE_SIZE = 10
+    MAIL_QUEUE_TIMEOUT = 1
+    MAIL_KEEPALIVE = 1
+    MAIL_OUTBOX = True
+    MAIL_DISPATCH_INTERVAL = 0
+    MAIL_BATCH_SIZE = 2
+    MAIL_MAX_ATTEMPTS = 3
+    MAIL_RETRY_DELAY = 0
+    MAIL_OUTBOX_RETENTION_DAYS = 7
+
+    # Pagination.
+    USERS_PER_PAGE = 10
+    PRODUCTS_PER_PAGE = 10
+    CARTS_PER_PAGE = 10
+
+    # Catalog responses cache.
+    RESPONSE_CACHE = "memory"
+    RESPONSE_CACHE_SIZE = 100
+    RESPONSE_CACHE_TTL = 60
+    RESPONSE_CACHE_DIR = os.path.join(tempfile.gettempdir(), f"shop-api-test-cache-{os.geteuid()}")
+
     # Cross origin resource sharing
     USE_CORS = False
 
@@ -75,3 +184,24 @@ class TestConfig:
     ACCESS_EXPIRATION_IN_MINUTES = 2
     REFRESH_TOKEN_IN_COOKIE = True 
     REFRESH_TOKEN_IN_BODY = False
+    SIGNED_ACCESS_TOKENS = False
+    REVOCATION_SYNC_INTERVAL = 10
+    TOKEN_STORE = "sqlalchemy"
+    TOKEN_STORE_ADDRESS = os.path.join(base_dir, "test_tokens.sock")
+    TOKENS_SWEEP_INTERVAL = 0
+    TOKENS_SWEEP_BATCH_SIZE = 2
+
+    # Password hashing.
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256:260000"
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = 0
+    PASSWORD_HASH_TIMEOUT = 5
+
+    # Verified access tokens cache.
+    TOKEN_CACHE_SIZE = 100
+    TOKEN_CACHE_TTL = 60
+
+    # Users last seen write-behind buffer, flushed manually in tests.
+    LAST_SEEN_GRANULARITY = 60
+    LAST_SEEN_FLUSH_INTERVAL = 0
+    LAST_SEEN_BUFFER_SIZE = 100
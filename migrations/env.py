@@ -71,6 +71,14 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # full-text search index is managed by hand written migrations,
+    # keep autogenerate from dropping it
+    def include_object(object, name, type_, reflected, compare_to):
+        if reflected and compare_to is None and name and \
+                (name.startswith('products_fts') or name == 'ix_products_search'):
+            return False
+        return True
+
     connectable = current_app.extensions['migrate'].db.get_engine()
 
     with connectable.connect() as connection:
@@ -78,6 +86,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
             **current_app.extensions['migrate'].configure_args
         )
 
@@ -0,0 +1,29 @@
+"""products updated_at
+
+Revision ID: 4e8b1f6a9c27
+Revises: 9c41e7a2b0d5
+Create Date: 2026-10-18 13:05:27.640112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e8b1f6a9c27'
+down_revision = '9c41e7a2b0d5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_products_updated_at'), ['updated_at'], unique=False)
+    op.execute("UPDATE products SET updated_at = CURRENT_TIMESTAMP")
+
+
+def downgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_products_updated_at'))
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,26 @@
+"""products name pattern index
+
+Revision ID: 8f3a6d2c1b59
+Revises: 5a2d7c8e1f43
+Create Date: 2026-10-20 09:32:17.405126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f3a6d2c1b59'
+down_revision = '5a2d7c8e1f43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("CREATE INDEX ix_products_category_name_pattern ON products (category_id, name text_pattern_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_products_category_name_pattern', table_name='products')
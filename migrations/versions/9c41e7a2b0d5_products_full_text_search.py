@@ -0,0 +1,34 @@
+"""products full-text search
+
+Revision ID: 9c41e7a2b0d5
+Revises: 58d22315e3e4
+Create Date: 2026-10-18 11:40:03.118954
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c41e7a2b0d5'
+down_revision = '58d22315e3e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE products_fts USING fts5(name, description, tokenize='porter unicode61')")
+        op.execute("INSERT INTO products_fts (rowid, name, description) SELECT product_id, name, description FROM products")
+    elif dialect == 'postgresql':
+        op.execute("CREATE INDEX ix_products_search ON products "
+                   "USING GIN (to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, '')))")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TABLE products_fts")
+    elif dialect == 'postgresql':
+        op.drop_index('ix_products_search', table_name='products')
@@ -0,0 +1,35 @@
+"""cart_items unique product
+
+Revision ID: d2a6c9f4e3b1
+Revises: b7d3a5e1c864
+Create Date: 2026-10-18 15:02:44.190587
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a6c9f4e3b1'
+down_revision = 'b7d3a5e1c864'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Merge duplicated items into the oldest one before adding unique index.
+    op.execute(
+        "UPDATE cart_items SET quantity = ("
+        "SELECT SUM(other.quantity) FROM cart_items AS other "
+        "WHERE other.cart_id = cart_items.cart_id AND other.product_id = cart_items.product_id) "
+        "WHERE item_id IN (SELECT MIN(item_id) FROM cart_items GROUP BY cart_id, product_id HAVING COUNT(*) > 1)"
+    )
+    op.execute(
+        "DELETE FROM cart_items WHERE item_id NOT IN ("
+        "SELECT keep.item_id FROM (SELECT MIN(item_id) AS item_id FROM cart_items GROUP BY cart_id, product_id) AS keep)"
+    )
+    op.create_index('ix_cart_items_cart_product', 'cart_items', ['cart_id', 'product_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_cart_items_cart_product', table_name='cart_items')
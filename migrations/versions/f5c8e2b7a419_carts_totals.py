@@ -0,0 +1,40 @@
+"""carts totals
+
+Revision ID: f5c8e2b7a419
+Revises: d2a6c9f4e3b1
+Create Date: 2026-10-18 16:37:52.304876
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5c8e2b7a419'
+down_revision = 'd2a6c9f4e3b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('carts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('item_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('subtotal_cents', sa.Integer(), server_default='0', nullable=False))
+    # cents are rounded half up like api.models.price_cents, SQLite CAST truncates
+    if op.get_bind().dialect.name == "sqlite":
+        cents = "CAST(products.price * 100 + 0.5 AS INTEGER)"
+    else:
+        cents = "CAST(FLOOR(products.price * 100 + 0.5) AS INTEGER)"
+    op.execute(
+        "UPDATE carts SET "
+        "item_count = COALESCE((SELECT SUM(quantity) FROM cart_items WHERE cart_items.cart_id = carts.cart_id), 0), "
+        f"subtotal_cents = COALESCE((SELECT SUM(cart_items.quantity * {cents}) "
+        "FROM cart_items JOIN products ON products.product_id = cart_items.product_id "
+        "WHERE cart_items.cart_id = carts.cart_id), 0)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('carts', schema=None) as batch_op:
+        batch_op.drop_column('subtotal_cents')
+        batch_op.drop_column('item_count')
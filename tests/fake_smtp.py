@@ -0,0 +1,73 @@
+"""Minimal SMTP server stand-in on a local port, so mail sending is tested
+offline. It accepts every message and counts connections."""
+import time
+from email import message_from_bytes
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from threading import Lock, Thread
+
+
+class FakeSMTPServer(ThreadingTCPServer):
+    """SMTP server keeping received messages in `messages`. `delay` adds
+    latency to every accepted message."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, delay: float=0.0):
+        super().__init__(("127.0.0.1", 0), FakeSMTPHandler)
+        self.delay = delay
+        self.connections = 0
+        self.messages = []
+        self.lock = Lock()
+        self.thread = Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeSMTPHandler(StreamRequestHandler):
+    """Session handler of `FakeSMTPServer`."""
+    def reply(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        self.reply("220 localhost ESMTP fake")
+        sender, recipients = None, []
+        for line in self.rfile:
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb == "EHLO":
+                self.wfile.write(b"250-localhost\r\n")
+                self.reply("250 8BITMIME")
+            elif verb == "HELO":
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                sender, recipients = command[10:].strip("<>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command[8:].strip("<>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = b"".join(iter(self.rfile.readline, b".\r\n"))
+                time.sleep(self.server.delay)
+                with self.server.lock:
+                    self.server.messages.append((sender, recipients, message_from_bytes(data)))
+                self.reply("250 OK")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
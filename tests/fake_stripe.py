@@ -0,0 +1,115 @@
+"""Local stand-ins for Stripe: signed webhook event payloads built the way
+Stripe does and a minimal Stripe API server, so payments are tested offline."""
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.parse import parse_qs
+
+
+def make_event(type: str, data_object: dict, event_id: str=None) -> dict:
+    """Build Stripe event."""
+    return {
+        "id": event_id or "evt_" + secrets.token_hex(12),
+        "object": "event",
+        "type": type,
+        "created": int(time.time()),
+        "data": {"object": data_object}
+    }
+
+
+def checkout_completed(cart_id: int, event_id: str=None) -> dict:
+    """Build 'checkout.session.completed' event of given cart."""
+    return make_event("checkout.session.completed", {
+        "id": "cs_test_" + secrets.token_hex(12),
+        "object": "checkout.session",
+        "payment_status": "paid",
+        "metadata": {"cart_id": str(cart_id)}
+    }, event_id)
+
+
+def sign(payload: str, secret: str, timestamp: int=None) -> str:
+    """Build 'Stripe-Signature' header of payload."""
+    timestamp = timestamp or int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def deliver(client, event: dict, secret: str, url: str="/api/event"):
+    """Post signed event to webhook endpoint with test client."""
+    payload = json.dumps(event)
+    return client.post(url, data=payload, content_type="application/json",
+                       headers={"Stripe-Signature": sign(payload, secret)})
+
+
+class FakeStripeServer(ThreadingHTTPServer):
+    """Stripe API stand-in serving checkout sessions on a local port. Requests
+    with known idempotency key are replayed like Stripe does. `delay` adds
+    latency to every request."""
+    daemon_threads = True
+
+    def __init__(self, delay: float=0.0):
+        super().__init__(("127.0.0.1", 0), FakeStripeHandler)
+        self.delay = delay
+        self.requests = []
+        self.sessions = {}
+        self.lock = Lock()
+        self.thread = Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+    def create_session(self, body: str, idempotency_key: str):
+        """Create session or replay the one made with the same key.
+        Return status code and response."""
+        with self.lock:
+            if idempotency_key in self.sessions:
+                replayed_body, session = self.sessions[idempotency_key]
+                if replayed_body != body:
+                    return 400, {"error": {"type": "idempotency_error", "message": "Keys for idempotent requests can only be used with the same parameters."}}
+                return 200, session
+            params = parse_qs(body)
+            session_id = "cs_test_" + secrets.token_hex(12)
+            session = {
+                "id": session_id,
+                "object": "checkout.session",
+                "url": f"https://checkout.stripe.com/c/pay/{session_id}",
+                "expires_at": int(params["expires_at"][0]),
+                "metadata": {"cart_id": params["metadata[cart_id]"][0]}
+            }
+            if idempotency_key:
+                self.sessions[idempotency_key] = (body, session)
+            return 200, session
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    """Request handler of `FakeStripeServer`."""
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        self.server.requests.append((self.path, body, dict(self.headers)))
+        time.sleep(self.server.delay)
+        if self.path == "/v1/checkout/sessions":
+            status, response = self.server.create_session(body, self.headers.get("Idempotency-Key"))
+        else:
+            status, response = 404, {"error": {"type": "invalid_request_error", "message": "Unrecognized request URL."}}
+        data = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,101 @@
+import os
+import pickle
+import tempfile
+import unittest
+from time import sleep, time
+
+from api.cache import FileResponseBackend, TTLCache
+
+
+class TTLCacheTestCase(unittest.TestCase):
+    """Test case for in-process TTL cache."""
+
+    def setUp(self):
+        """Instructions that will be executed before each test method."""
+        self.cache = TTLCache(maxsize=2, ttl=60)
+
+    def test_hit_and_miss(self):
+        """Test hit/miss counters."""
+        self.cache.set("a", 1)
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_lru_eviction(self):
+        """Test least recently used entry is evicted."""
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")
+        self.cache.set("c", 3)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), 1)
+
+    def test_ttl_expiration(self):
+        """Test entries expire after ttl."""
+        self.cache.set("a", 1, ttl=0.1)
+        sleep(0.2)
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_delete_where(self):
+        """Test entries are deleted by predicate."""
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.delete_where(lambda value: value == 1)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("b"), 2)
+
+
+class FileResponseBackendTestCase(unittest.TestCase):
+    """Test case for file response cache backend."""
+
+    def setUp(self):
+        """Instructions that will be executed before each test method."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.backend = FileResponseBackend(self.directory.name, ttl=60)
+
+    def test_set_get(self):
+        """Test entry is visible to another backend on same directory."""
+        generation = self.backend.generation("product:1")
+        self.backend.set("product:1", generation, "/api/products/1?", ("etag", b"{}", "application/json"))
+        other = FileResponseBackend(self.directory.name, ttl=60)
+        self.assertEqual(other.get("product:1", other.generation("product:1"), "/api/products/1?")[0], "etag")
+
+    def test_invalidate(self):
+        """Test invalidated tag entries are not served."""
+        generation = self.backend.generation("product:1")
+        self.backend.set("product:1", generation, "key", ("etag", b"{}", "application/json"))
+        self.backend.invalidate("product:1")
+        self.assertNotEqual(self.backend.generation("product:1"), generation)
+        self.assertIsNone(self.backend.get("product:1", self.backend.generation("product:1"), "key"))
+
+    def test_entry_format(self):
+        """Test entry is stored as JSON header and raw body, garbage is a miss."""
+        self.backend.set("product:1", "0", "key", ("etag", b'{"a": 1}\n', "application/json"))
+        self.assertEqual(self.backend.get("product:1", "0", "key"), ("etag", b'{"a": 1}\n', "application/json"))
+        with open(self.backend._entry_path("product:1", "0", "key"), "wb") as f:
+            f.write(pickle.dumps(("etag", b"{}", "application/json")))
+        self.assertIsNone(self.backend.get("product:1", "0", "key"))
+
+    def test_unsafe_directory(self):
+        """Test directory writable by others is refused."""
+        os.chmod(self.directory.name, 0o777)
+        with self.assertRaises(RuntimeError):
+            FileResponseBackend(self.directory.name, ttl=60)
+        directory = os.path.join(self.directory.name, "cache")
+        FileResponseBackend(directory, ttl=60)
+        self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+
+    def test_cleanup(self):
+        """Test expired entry files are removed."""
+        self.backend.set("product:1", "0", "old", ("etag", b"{}", "application/json"))
+        self.backend.set("product:1", "0", "new", ("etag", b"{}", "application/json"))
+        old = self.backend._entry_path("product:1", "0", "old")
+        os.utime(old, (time() - 120, time() - 120))
+        self.assertEqual(self.backend.cleanup(), 1)
+        self.assertFalse(os.path.exists(old))
+        self.assertIsNotNone(self.backend.get("product:1", "0", "new"))
+
+    def tearDown(self):
+        """Instructions that will be executed after each test method"""
+        self.directory.cleanup()
@@ -0,0 +1,319 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from api import create_app, mail_templates, payments
+from api.models import db, Cart, CartItem, CartStatus, price_cents, Product, ProductCategory, to_cents, User
+from config import TestConfig
+from tests import count_queries
+from tests.fake_stripe import FakeStripeServer
+
+
+class CartsTestCase(unittest.TestCase):
+    """Test case for carts endpoints."""
+    def setUp(self):
+        """Instructions that will be executed before each test method."""
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add_all([CartStatus(name=name) for name in self.app.config["CART_STATUSES"]])
+        user = User(username="john", email="john@example.com", password="cat")
+        token = user.generate_access_token()
+        category = ProductCategory(name="books")
+        self.product = Product(name="Dune", price=9.99, category=category)
+        db.session.add_all([token, self.product])
+        db.session.commit()
+        self.product_id = self.product.product_id
+        self.headers = {"Authorization": f"Bearer {token.access_token}"}
+        self.client = self.app.test_client()
+        self.cart_id = self.client.post("/api/carts", headers=self.headers).json["cart_id"]
+
+    def items(self):
+        """Cart items as product id to quantity."""
+        db.session.expire_all()
+        return {item.product_id: item.quantity for item in CartItem.query.filter_by(cart_id=self.cart_id)}
+
+    def count_queries(self):
+        """Collect SQL statements executed inside the block."""
+        return count_queries(db.get_engine(self.app))
+
+    def add_products(self, count: int):
+        """Put `count` different products in the cart."""
+        products = [Product(name=f"Book {i}", price=i, category_id=self.product.category_id) for i in range(count)]
+        db.session.add_all(products)
+        db.session.commit()
+        self.client.patch(f"/api/carts/{self.cart_id}/items", headers=self.headers, json={"items": [
+            {"product_id": product.product_id, "quantity": 1} for product in products
+        ]})
+
+    def test_get_queries(self):
+        """Test cart is retrieved with one query regardless of items count."""
+        self.add_products(5)
+        with self.count_queries() as statements:
+            response = self.client.get(f"/api/carts/{self.cart_id}", headers=self.headers)
+        self.assertEqual(len(response.json["items"]), 5)
+        self.assertEqual(len(statements), 1)
+
+    def test_order_summary(self):
+        """Test order view model is read with one query and rendered
+        without the session."""
+        self.add_products(3)
+        with self.count_queries() as statements:
+            order = Cart.order_summary(self.cart_id)
+        self.assertEqual(len(statements), 1)
+        self.assertEqual([line["name"] for line in order["lines"]], ["Book 0", "Book 1", "Book 2"])
+        self.assertEqual(order["username"], "john")
+        self.assertEqual(order["item_count"], 3)
+        self.assertEqual(order["subtotal"], 3.0)
+        db.session.remove()
+        with self.count_queries() as statements, ThreadPoolExecutor(1) as executor:
+            text = executor.submit(mail_templates.render, "admin/success.txt", order=order).result()
+        self.assertEqual(len(statements), 0)
+        self.assertIn("Book 2 - 2.0 - 1", text)
+        self.assertIn(f"Order id: {self.cart_id}", text)
+        self.assertIsNone(Cart.order_summary(0))
+
+    def test_paid_digest(self):
+        """Test paid carts are summed up with one query."""
+        self.add_products(4)
+        self.client.patch(f"/api/carts/{self.cart_id}/items", headers=self.headers, json={"items": [
+            {"product_id": self.product_id, "quantity": 2}
+        ]})
+        now = datetime.utcnow()
+        user_id = db.session.get(Cart, self.cart_id).user_id
+        other = Cart(user_id=user_id, paid_at=now - timedelta(days=2))
+        db.session.add(other)
+        db.session.get(Cart, self.cart_id).paid_at = now - timedelta(hours=1)
+        db.session.commit()
+        with self.count_queries() as statements:
+            digest = Cart.paid_digest(now - timedelta(days=1), now, top=2)
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(digest["orders"], 1)
+        self.assertEqual(digest["item_count"], 6)
+        self.assertEqual(digest["revenue"], round(0 + 1 + 2 + 3 + 2 * 9.99, 2))
+        self.assertEqual(digest["products"], [
+            {"name": "Dune", "quantity": 2, "revenue": 19.98},
+            {"name": "Book 3", "quantity": 1, "revenue": 3.0}
+        ])
+        empty = Cart.paid_digest(now, now + timedelta(days=1))
+        self.assertEqual((empty["orders"], empty["revenue"], empty["products"]), (0, 0.0, []))
+
+    def test_add_queries(self):
+        """Test adding product doesn't load items one by one."""
+        self.add_products(5)
+        with self.count_queries() as statements:
+            response = self.client.post(f"/api/carts/{self.cart_id}/products/{self.product_id}", headers=self.headers)
+        self.assertEqual(len(response.json["items"]), 6)
+        # retrieve, upsert, totals update and reload after commit
+        self.assertEqual(len(statements), 4)
+
+    def test_foreign_cart(self):
+        """Test other user's cart is forbidden and unknown cart is not found."""
+        user = User(username="jane", email="jane@example.com", password="cat")
+        token = user.generate_access_token()
+        db.session.add(token)
+        db.session.commit()
+        headers = {"Authorization": f"Bearer {token.access_token}"}
+        self.assertEqual(self.client.get(f"/api/carts/{self.cart_id}", headers=headers).status_code, 403)
+        self.assertEqual(self.client.get("/api/carts/999", headers=headers).status_code, 404)
+
+    def test_list_carts(self):
+        """Test listing own carts with cursor and page pagination."""
+        self.add_products(2)
+        for _ in range(2):
+            self.client.post("/api/carts", headers=self.headers)
+        response = self.client.get("/api/carts?after=0&per_page=2", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["data"][0]["cart_id"], self.cart_id)
+        self.assertEqual(len(response.json["data"][0]["items"]), 2)
+        cursor = response.json["pagination"]["next_cursor"]
+        response = self.client.get(f"/api/carts?after={cursor}&per_page=2", headers=self.headers)
+        self.assertEqual(len(response.json["data"]), 1)
+        self.assertIsNone(response.json["pagination"]["next_cursor"])
+
+        response = self.client.get("/api/carts?page=2&per_page=2", headers=self.headers)
+        self.assertEqual(len(response.json["data"]), 1)
+        self.assertEqual(response.json["pagination"]["total"], 3)
+
+    def test_status_ids_cached(self):
+        """Test statuses are not queried once loaded."""
+        with self.count_queries() as statements:
+            response = self.client.post("/api/carts", headers=self.headers)
+        self.assertEqual(response.json["status"]["name"], "ready to pay")
+        self.assertFalse([statement for statement in statements if "FROM cart_statuses" in statement])
+
+    def test_paid_cart(self):
+        """Test paid cart can't be changed."""
+        cart = db.session.get(Cart, self.cart_id)
+        cart.status = CartStatus.query.filter_by(name="paid").first()
+        db.session.commit()
+        response = self.client.post(f"/api/carts/{self.cart_id}/products/{self.product_id}", headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json["message"], "Cart is paid.")
+
+    def test_checkout_session_reused(self):
+        """Test unchanged cart reuses checkout session, changed cart gets new one."""
+        self.add_products(2)
+        url = f"/api/carts/{self.cart_id}/checkout"
+        with FakeStripeServer() as stripe_server:
+            self.app.config["STRIPE_API_BASE"] = stripe_server.url
+            payments.init_app(self.app)
+            first = self.client.post(url, headers=self.headers)
+            self.assertEqual(first.status_code, 200)
+            second = self.client.post(url, headers=self.headers)
+            self.assertEqual(second.json["url"], first.json["url"])
+            self.assertEqual(len(stripe_server.requests), 1)
+            path, body, headers = stripe_server.requests[0]
+            self.assertIn("Idempotency-Key", headers)
+            self.assertIn("Bearer sk_test_key", headers["Authorization"])
+
+            self.client.post(f"/api/carts/{self.cart_id}/products/{self.product_id}", headers=self.headers)
+            third = self.client.post(url, headers=self.headers)
+            self.assertNotEqual(third.json["url"], first.json["url"])
+            self.assertEqual(len(stripe_server.requests), 2)
+
+    def test_checkout_double_click(self):
+        """Test concurrent checkouts of one cart get one Stripe session."""
+        self.add_products(2)
+        url = f"/api/carts/{self.cart_id}/checkout"
+        with FakeStripeServer(delay=0.2) as stripe_server:
+            self.app.config["STRIPE_API_BASE"] = stripe_server.url
+            payments.init_app(self.app)
+            with ThreadPoolExecutor(2) as executor:
+                responses = list(executor.map(lambda _: self.app.test_client().post(url, headers=self.headers), range(2)))
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertEqual(responses[0].json["url"], responses[1].json["url"])
+        self.assertEqual(len(stripe_server.sessions), 1)
+
+    def test_checkout_empty_cart(self):
+        """Test empty cart can't be checked out."""
+        response = self.client.post(f"/api/carts/{self.cart_id}/checkout", headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json["message"], "Cart is empty.")
+
+    def test_add_remove_product(self):
+        """Test adding product increments and removing decrements single item."""
+        url = f"/api/carts/{self.cart_id}/products/{self.product_id}"
+        self.assertEqual(self.client.post(url, headers=self.headers).status_code, 201)
+        response = self.client.post(url, headers=self.headers)
+        self.assertEqual(response.json["items"][0]["quantity"], 2)
+        self.assertEqual(self.items(), {self.product_id: 2})
+
+        self.assertEqual(self.client.delete(url, headers=self.headers).status_code, 204)
+        self.assertEqual(self.items(), {self.product_id: 1})
+        self.assertEqual(self.client.delete(url, headers=self.headers).status_code, 204)
+        self.assertEqual(self.items(), {})
+        self.assertEqual(self.client.delete(url, headers=self.headers).status_code, 404)
+
+    def test_cents_rounding(self):
+        """Test SQL and Python convert prices to the same cents."""
+        prices = [1.005, 0.285, 2.675, 1.115, 0.125, 9.995, 19.99]
+        products = [Product(name=f"Book {price}", price=price, category_id=self.product.category_id) for price in prices]
+        db.session.add_all(products)
+        db.session.commit()
+        cents = dict(db.session.query(Product.price, price_cents(Product.price)).filter(Product.price.in_(prices)))
+        self.assertEqual(cents, {price: to_cents(price) for price in prices})
+
+    def test_totals(self):
+        """Test cart totals follow item changes and product price changes."""
+        other = Product(name="Emma", price=0.1, category_id=self.product.category_id)
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.product_id
+        self.client.post(f"/api/carts/{self.cart_id}/products/{self.product_id}", headers=self.headers)
+        response = self.client.patch(f"/api/carts/{self.cart_id}/items", headers=self.headers, json={"items": [
+            {"product_id": other_id, "quantity": 3},
+            {"product_id": self.product_id, "delta": 1}
+        ]})
+        self.assertEqual(response.json["item_count"], 5)
+        self.assertEqual(response.json["subtotal"], 20.28)
+        totals = {item["product"]["product_id"]: item["total"] for item in response.json["items"]}
+        self.assertEqual(totals, {self.product_id: 19.98, other_id: 0.3})
+
+        self.client.delete(f"/api/carts/{self.cart_id}/products/{other_id}", headers=self.headers)
+        response = self.client.get(f"/api/carts/{self.cart_id}", headers=self.headers)
+        self.assertEqual((response.json["item_count"], response.json["subtotal"]), (4, 20.18))
+
+        admin = User(username="admin", email=self.app.config["ADMIN_EMAIL"], password="cat")
+        token = admin.generate_access_token()
+        db.session.add(token)
+        db.session.commit()
+        admin_headers = {"Authorization": f"Bearer {token.access_token}"}
+        self.client.put(f"/api/products/{self.product_id}", headers=admin_headers, json={"price": 5.0})
+        response = self.client.get(f"/api/carts/{self.cart_id}", headers=self.headers)
+        self.assertEqual(response.json["subtotal"], 10.2)
+        self.client.delete(f"/api/products/{other_id}", headers=admin_headers)
+        response = self.client.get(f"/api/carts/{self.cart_id}", headers=self.headers)
+        self.assertEqual((response.json["item_count"], response.json["subtotal"]), (2, 10.0))
+
+    def test_add_missing_product(self):
+        """Test adding unknown product."""
+        response = self.client.post(f"/api/carts/{self.cart_id}/products/999", headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.items(), {})
+
+    def test_update_items(self):
+        """Test setting and incrementing many items in one request."""
+        other = Product(name="Emma", price=4.5, category_id=self.product.category_id)
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.product_id
+        url = f"/api/carts/{self.cart_id}/items"
+
+        response = self.client.patch(url, headers=self.headers, json={"items": [
+            {"product_id": self.product_id, "quantity": 2},
+            {"product_id": other_id, "delta": 3},
+            {"product_id": self.product_id, "delta": 1}
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json["items"]), 2)
+        self.assertEqual(self.items(), {self.product_id: 3, other_id: 3})
+
+        self.client.patch(url, headers=self.headers, json={"items": [
+            {"product_id": self.product_id, "delta": -1},
+            {"product_id": other_id, "quantity": 0}
+        ]})
+        self.assertEqual(self.items(), {self.product_id: 2})
+
+    def test_update_items_invalid(self):
+        """Test cart items changes are validated before any is applied."""
+        url = f"/api/carts/{self.cart_id}/items"
+        response = self.client.patch(url, headers=self.headers, json={"items": [
+            {"product_id": self.product_id, "quantity": 1},
+            {"product_id": 999, "quantity": 1}
+        ]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json["detail"], {"product_ids": [999]})
+        self.assertEqual(self.items(), {})
+
+        response = self.client.patch(url, headers=self.headers, json={"items": [
+            {"product_id": self.product_id, "quantity": 1, "delta": 1}
+        ]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_concurrent_adds(self):
+        """Test concurrent adds of one product end up in one item."""
+        url = f"/api/carts/{self.cart_id}/products/{self.product_id}"
+
+        def add(_):
+            return self.app.test_client().post(url, headers=self.headers).status_code
+
+        with ThreadPoolExecutor(8) as executor:
+            statuses = list(executor.map(add, range(40)))
+        self.assertEqual(statuses, [201] * 40)
+        self.assertEqual(self.items(), {self.product_id: 40})
+
+        def remove(_):
+            return self.app.test_client().delete(url, headers=self.headers).status_code
+
+        with ThreadPoolExecutor(8) as executor:
+            statuses = list(executor.map(remove, range(40)))
+        self.assertEqual(statuses, [204] * 40)
+        self.assertEqual(self.items(), {})
+
+    def tearDown(self):
+        """Instructions that will be executed after each test method"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
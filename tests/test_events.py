@@ -0,0 +1,150 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from api import create_app, mail_pool
+from api.email import send_mail as real_send_mail
+from api.events import process_events, worker
+from api.models import db, Cart, CartStatus, OutboxMessage, User, WebhookEvent
+from config import TestConfig
+from tests import fake_stripe
+
+
+class EventsTestCase(unittest.TestCase):
+    """Test case for Stripe webhook events inbox."""
+    def setUp(self):
+        """Instructions that will be executed before each test method."""
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        statuses = {name: CartStatus(name=name) for name in self.app.config["CART_STATUSES"]}
+        user = User(username="john", email="john@example.com", password="cat")
+        cart = Cart(user=user, status=statuses["ready to pay"])
+        db.session.add_all([*statuses.values(), cart])
+        db.session.commit()
+        self.cart_id = cart.cart_id
+        self.paid_id = statuses["paid"].status_id
+        self.secret = self.app.config["STRIPE_WEBHOOK_SECRET"]
+        self.client = self.app.test_client()
+
+    def status_id(self) -> int:
+        """Current status id of test cart."""
+        db.session.expire_all()
+        return db.session.get(Cart, self.cart_id).status_id
+
+    def test_webhook_stores_event(self):
+        """Test webhook only stores verified event, once."""
+        event = fake_stripe.checkout_completed(self.cart_id)
+        for _ in range(2):
+            response = fake_stripe.deliver(self.client, event, self.secret)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(WebhookEvent.query.count(), 1)
+        self.assertNotEqual(self.status_id(), self.paid_id)
+
+    def test_webhook_rejects_bad_signature(self):
+        """Test event signed with other secret is rejected."""
+        event = fake_stripe.checkout_completed(self.cart_id)
+        response = fake_stripe.deliver(self.client, event, "whsec_other")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post("/api/event", data="{}")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(WebhookEvent.query.count(), 0)
+
+    def test_process_events(self):
+        """Test worker marks cart paid and processes each event once."""
+        fake_stripe.deliver(self.client, fake_stripe.checkout_completed(self.cart_id), self.secret)
+        fake_stripe.deliver(self.client, fake_stripe.checkout_completed(self.cart_id), self.secret)
+        fake_stripe.deliver(self.client, fake_stripe.make_event("customer.created", {}), self.secret)
+        self.assertEqual(process_events(), 3)
+        self.assertEqual(self.status_id(), self.paid_id)
+        recipients = [message.recipients for message in OutboxMessage.query.order_by(OutboxMessage.message_id)]
+        self.assertEqual(recipients, ["john@example.com", self.app.config["ADMIN_EMAIL"]])
+        self.assertEqual(process_events(), 0)
+
+    def test_admin_order_mail_opt_in(self):
+        """Test admin gets no mail per order by default, cart paid time is kept
+        for digest."""
+        self.app.config["ADMIN_ORDER_MAIL"] = False
+        fake_stripe.deliver(self.client, fake_stripe.checkout_completed(self.cart_id), self.secret)
+        self.assertEqual(process_events(), 1)
+        self.assertEqual([message.recipients for message in OutboxMessage.query], ["john@example.com"])
+        self.assertIsNotNone(db.session.get(Cart, self.cart_id).paid_at)
+
+    def test_process_retries(self):
+        """Test failed event is retried and given up after max attempts."""
+        fake_stripe.deliver(self.client, fake_stripe.checkout_completed(self.cart_id, "evt_1"), self.secret)
+        failures = [RuntimeError("Template error")]
+
+        def send_mail(*args, **kwargs):
+            if failures:
+                raise failures.pop()
+            return real_send_mail(*args, **kwargs)
+
+        with mock.patch("api.events.send_mail", side_effect=send_mail):
+            self.assertEqual(process_events(), 1)
+        event = db.session.get(WebhookEvent, "evt_1")
+        self.assertEqual(event.attempts, 2)
+        self.assertIsNotNone(event.processed_at)
+        self.assertEqual(self.status_id(), self.paid_id)
+        # mails of failed attempt are rolled back with the cart status and queued by retry
+        recipients = [message.recipients for message in OutboxMessage.query.order_by(OutboxMessage.message_id)]
+        self.assertEqual(recipients, ["john@example.com", self.app.config["ADMIN_EMAIL"]])
+
+        fake_stripe.deliver(self.client, fake_stripe.make_event("checkout.session.completed", {}, "evt_2"), self.secret)
+        self.assertEqual(process_events(), 0)
+        event = db.session.get(WebhookEvent, "evt_2")
+        self.assertEqual(event.attempts, self.app.config["EVENTS_MAX_ATTEMPTS"])
+        self.assertIn("KeyError", event.last_error)
+        self.assertIsNone(event.processed_at)
+
+    def test_retry_without_outbox(self):
+        """Test mail of failed attempt is not sent when outbox is disabled."""
+        self.app.config["MAIL_OUTBOX"] = False
+        fake_stripe.deliver(self.client, fake_stripe.checkout_completed(self.cart_id, "evt_1"), self.secret)
+        calls = []
+
+        def send_mail(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("Mail queue is full.")
+            return real_send_mail(*args, **kwargs)
+
+        with mock.patch("api.events.send_mail", side_effect=send_mail), \
+                mock.patch.object(mail_pool, "submit") as submit:
+            self.assertEqual(process_events(), 1)
+        self.assertEqual(db.session.get(WebhookEvent, "evt_1").attempts, 2)
+        recipients = [msg.recipients for (msg,), _ in submit.call_args_list]
+        self.assertEqual(recipients, [["john@example.com"], [self.app.config["ADMIN_EMAIL"]]])
+        self.assertEqual(OutboxMessage.query.count(), 0)
+
+    def test_leased_event_skipped(self):
+        """Test event leased by other worker is not processed."""
+        fake_stripe.deliver(self.client, fake_stripe.checkout_completed(self.cart_id, "evt_1"), self.secret)
+        now = datetime.utcnow()
+        self.assertTrue(WebhookEvent.lease("evt_1", now, datetime(2100, 1, 1)))
+        db.session.commit()
+        self.assertEqual(process_events(), 0)
+
+    def test_worker_started_by_request(self):
+        """Test enabled worker is started by first request."""
+        self.app.config["EVENTS_PROCESS_INTERVAL"] = 60
+        self.assertFalse(worker._thread and worker._thread.is_alive())
+        self.client.get("/api/products")
+        try:
+            self.assertTrue(worker._thread.is_alive())
+        finally:
+            worker.stop()
+
+    def test_process_command(self):
+        """Test events process command."""
+        fake_stripe.deliver(self.client, fake_stripe.checkout_completed(self.cart_id), self.secret)
+        with mock.patch("api.events.send_mail"):
+            result = self.app.test_cli_runner().invoke(args=["events", "process"])
+        self.assertIn("processed 1 events", result.output)
+
+    def tearDown(self):
+        """Instructions that will be executed after each test method"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
@@ -0,0 +1,251 @@
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from flask_mail import Message
+
+from api import create_app, mail, mail_pool
+from api.email import send_mail
+from api.models import db, Cart, CartItem, CartStatus, OutboxMessage, Product, User
+from api.outbox import dispatch_mail
+from config import TestConfig
+from tests.fake_smtp import FakeSMTPServer
+
+ORDER = {
+    "cart_id": 1,
+    "username": "john",
+    "email": "john@example.com",
+    "lines": [{"name": "Dune", "price": 9.99, "quantity": 2, "total": 19.98}],
+    "item_count": 2,
+    "subtotal": 19.98
+}
+
+
+class MailPoolTestCase(unittest.TestCase):
+    """Test case for mail worker pool."""
+    def setUp(self):
+        """Instructions that will be executed before each test method."""
+        self.server = FakeSMTPServer().__enter__()
+        self.app = create_app(TestConfig)
+        self.app.config.update(
+            MAIL_SUPPRESS_SEND=False,
+            MAIL_SERVER="127.0.0.1",
+            MAIL_PORT=self.server.port,
+            MAIL_USE_TLS=False,
+            MAIL_WORKERS=2,
+            MAIL_KEEPALIVE=5,
+            MAIL_OUTBOX=False
+        )
+        mail.init_app(self.app)
+        mail_pool.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        """Instructions that will be executed after each test method."""
+        mail_pool.shutdown()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.server.__exit__()
+
+    def message(self, n: int) -> Message:
+        """Build test message."""
+        return Message(f"Message {n}", sender="shop@example.com", recipients=["john@example.com"], body="Hello")
+
+    def test_connections_reused(self):
+        """Test burst of messages is sent over one connection per worker."""
+        for n in range(20):
+            mail_pool.submit(self.message(n))
+        mail_pool.shutdown()
+        self.assertEqual(len(self.server.messages), 20)
+        self.assertLessEqual(self.server.connections, 2)
+        stats = mail_pool.stats()
+        self.assertEqual(stats["sent"], 20)
+        self.assertEqual(stats["failed"], 0)
+        self.assertEqual(stats["queued"], 0)
+        self.assertEqual(stats["connections"], self.server.connections)
+        self.assertGreater(stats["max_send_time"], 0)
+
+    def test_idle_connection_closed(self):
+        """Test worker reconnects after keepalive period."""
+        self.app.config.update(MAIL_WORKERS=1, MAIL_KEEPALIVE=0.05)
+        mail_pool.init_app(self.app)
+        mail_pool.submit(self.message(1))
+        time.sleep(0.3)
+        mail_pool.submit(self.message(2))
+        mail_pool.shutdown()
+        self.assertEqual(len(self.server.messages), 2)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_queue_full(self):
+        """Test submit fails when queue stays full."""
+        self.server.delay = 0.5
+        self.app.config.update(MAIL_WORKERS=1, MAIL_QUEUE_SIZE=1, MAIL_QUEUE_TIMEOUT=0.05)
+        mail_pool.init_app(self.app)
+        with self.assertRaises(RuntimeError):
+            for n in range(5):
+                mail_pool.submit(self.message(n))
+
+    def test_shutdown_timeout(self):
+        """Test shutdown gives up on full queue and busy worker."""
+        self.server.delay = 0.5
+        self.app.config.update(MAIL_WORKERS=1, MAIL_QUEUE_SIZE=1)
+        mail_pool.init_app(self.app)
+        mail_pool.submit(self.message(1))
+        time.sleep(0.05)
+        mail_pool.submit(self.message(2))
+        start = time.monotonic()
+        with self.assertLogs(self.app.logger, "WARNING"):
+            mail_pool.shutdown(0.1)
+        self.assertLess(time.monotonic() - start, 0.4)
+
+    def test_inline_sending(self):
+        """Test messages are sent on calling thread without workers."""
+        self.app.config["MAIL_WORKERS"] = 0
+        mail_pool.init_app(self.app)
+        mail_pool.submit(self.message(1))
+        self.assertEqual(len(self.server.messages), 1)
+        self.assertEqual(mail_pool.stats()["sent"], 1)
+
+    def test_send_mail(self):
+        """Test rendered order mail goes through pool after commit."""
+        user = User(username="john", email="john@example.com", password="cat")
+        cart = Cart(user=user, status=CartStatus(name="paid"))
+        db.session.add(cart)
+        db.session.commit()
+        send_mail("Successful payment", user.email, "user/success", order=Cart.order_summary(cart.cart_id))
+        db.session.commit()
+        mail_pool.shutdown()
+        sender, recipients, message = self.server.messages[0]
+        self.assertEqual(sender, "shop@example.com")
+        self.assertEqual(recipients, ["john@example.com"])
+        self.assertEqual(message["Subject"], "Successful payment")
+
+
+class OutboxTestCase(unittest.TestCase):
+    """Test case for mail outbox dispatcher."""
+    def setUp(self):
+        """Instructions that will be executed before each test method."""
+        self.server = FakeSMTPServer().__enter__()
+        self.app = create_app(TestConfig)
+        self.app.config.update(
+            MAIL_SUPPRESS_SEND=False,
+            MAIL_SERVER="127.0.0.1",
+            MAIL_PORT=self.server.port,
+            MAIL_USE_TLS=False
+        )
+        mail.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(username="john", email="john@example.com", password="cat")
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        """Instructions that will be executed after each test method."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        self.server.__exit__()
+
+    def queue(self, n: int):
+        """Write test messages to outbox."""
+        for i in range(n):
+            send_mail(f"Message {i}", self.user.email, "user/success", order=ORDER)
+        db.session.commit()
+
+    def test_send_mail_in_transaction(self):
+        """Test mail is written to outbox and dropped on rollback."""
+        send_mail("Message", "john@example.com", "user/success", order=ORDER)
+        db.session.rollback()
+        self.assertEqual(OutboxMessage.query.count(), 0)
+        self.queue(1)
+        message = OutboxMessage.query.one()
+        self.assertEqual(message.recipients, "john@example.com")
+        self.assertIn("Dear john", message.body)
+        self.assertEqual(len(self.server.messages), 0)
+
+    def test_dispatch(self):
+        """Test messages are sent in batches, one connection per batch."""
+        self.queue(5)
+        self.assertEqual(dispatch_mail(), 5)
+        self.assertEqual(len(self.server.messages), 5)
+        self.assertEqual(self.server.connections, 3)
+        self.assertEqual(OutboxMessage.query.filter(OutboxMessage.sent_at.is_(None)).count(), 0)
+        self.assertEqual(dispatch_mail(), 0)
+        self.assertEqual(len(self.server.messages), 5)
+
+    def test_dispatch_retries(self):
+        """Test failed messages are retried and given up after max attempts."""
+        self.queue(3)
+        self.server.__exit__()
+        self.assertEqual(dispatch_mail(), 0)
+        messages = OutboxMessage.query.all()
+        self.assertTrue(all(message.attempts == self.app.config["MAIL_MAX_ATTEMPTS"] for message in messages))
+        self.assertTrue(all(message.last_error for message in messages))
+
+        self.server = FakeSMTPServer().__enter__()
+        self.app.config.update(MAIL_PORT=self.server.port, MAIL_MAX_ATTEMPTS=4)
+        mail.init_app(self.app)
+        self.assertEqual(dispatch_mail(), 3)
+
+    def test_given_up_logged(self):
+        """Test message is logged when it is given up."""
+        self.queue(1)
+        self.server.__exit__()
+        with self.assertLogs(self.app.logger, "ERROR") as logs:
+            dispatch_mail()
+        self.assertTrue(any("Gave up sending mail" in line for line in logs.output))
+
+    def test_clean(self):
+        """Test sent and given up messages are deleted after retention."""
+        self.queue(3)
+        old = datetime.utcnow() - timedelta(days=8)
+        messages = OutboxMessage.query.order_by(OutboxMessage.message_id).all()
+        messages[0].sent_at = messages[0].created_at = old
+        messages[1].attempts, messages[1].created_at = self.app.config["MAIL_MAX_ATTEMPTS"], old
+        messages[2].created_at = old
+        db.session.commit()
+        result = self.app.test_cli_runner().invoke(args=["mail", "clean"])
+        self.assertIn("deleted 2 messages", result.output)
+        self.assertEqual(OutboxMessage.query.count(), 1)
+
+    def test_leased_messages_skipped(self):
+        """Test messages leased by other dispatcher are not sent."""
+        self.queue(3)
+        now = datetime.utcnow()
+        leased = OutboxMessage.claim(now, datetime(2100, 1, 1), 2, self.app.config["MAIL_MAX_ATTEMPTS"])
+        db.session.commit()
+        self.assertEqual(len(leased), 2)
+        self.assertEqual(dispatch_mail(), 1)
+
+    def test_digest_command(self):
+        """Test digest of paid carts is queued as one admin mail."""
+        now = datetime.utcnow()
+        db.session.add_all([Cart(user=self.user, paid_at=now - timedelta(hours=2)) for _ in range(2)])
+        db.session.commit()
+        result = self.app.test_cli_runner().invoke(args=["mail", "digest"])
+        self.assertIn("summed up 2 orders", result.output)
+        self.assertIn("Orders: 2", OutboxMessage.query.one().body)
+        OutboxMessage.query.delete()
+        db.session.commit()
+
+        product = Product(name="Dune", price=9.99)
+        db.session.add_all([CartItem(cart=cart, product=product, quantity=1) for cart in Cart.query])
+        db.session.commit()
+        result = self.app.test_cli_runner().invoke(args=["mail", "digest"])
+        self.assertIn("summed up 2 orders", result.output)
+        message = OutboxMessage.query.one()
+        self.assertEqual(message.recipients, self.app.config["ADMIN_EMAIL"])
+        self.assertIn("Orders: 2", message.body)
+        self.assertIn("Dune - 2 - 19.98", message.body)
+
+    def test_dispatch_command(self):
+        """Test mail dispatch command."""
+        self.queue(2)
+        result = self.app.test_cli_runner().invoke(args=["mail", "dispatch"])
+        self.assertIn("sent 2 messages", result.output)
+        self.assertEqual(len(self.server.messages), 2)
@@ -0,0 +1,332 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from functools import partial
+from unittest import mock
+
+from sqlalchemy.dialects import postgresql
+
+from api import create_app, response_cache, search
+from api.catalog import import_products
+from api.models import db, Product, ProductCategory, User
+from api.products import name_prefix
+from config import TestConfig
+from tests import count_queries
+
+
+class ProductsTestCase(unittest.TestCase):
+    """Test case for products endpoints."""
+    config = TestConfig
+
+    def setUp(self):
+        """Instructions that will be executed before each test method."""
+        self.app = create_app(self.config)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        admin = User(username="admin", email=self.app.config["ADMIN_EMAIL"], password="cat")
+        token = admin.generate_access_token()
+        self.category = ProductCategory(name="books")
+        self.product = Product(name="Dune", description="Sci-fi", price=9.99, category=self.category)
+        db.session.add_all([token, self.category, self.product])
+        db.session.flush()
+        search.index_product(self.product)
+        db.session.commit()
+        self.headers = {"Authorization": f"Bearer {token.access_token}"}
+        self.client = self.app.test_client()
+
+    def test_product_etag(self):
+        """Test product response has ETag and unchanged product gets 304."""
+        response = self.client.get(f"/api/products/{self.product.product_id}", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+
+        hits = response_cache.hits
+        response = self.client.get(f"/api/products/{self.product.product_id}",
+                                   headers={**self.headers, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response_cache.hits, hits + 1)
+
+    def test_product_invalidated_on_put(self):
+        """Test product update invalidates cached product and listing."""
+        url = f"/api/products/{self.product.product_id}"
+        listing = f"/api/category/{self.category.category_id}/products"
+        etag = self.client.get(url, headers=self.headers).headers["ETag"]
+        self.client.get(listing, headers=self.headers)
+
+        response = self.client.put(url, headers=self.headers, json={"price": 5.0})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(url, headers={**self.headers, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["price"], 5.0)
+        response = self.client.get(listing, headers=self.headers)
+        self.assertEqual(response.json["data"][0]["price"], 5.0)
+
+    def test_listing_invalidated_on_create(self):
+        """Test new product shows up in cached category listing."""
+        listing = f"/api/category/{self.category.category_id}/products"
+        self.assertEqual(len(self.client.get(listing, headers=self.headers).json["data"]), 1)
+        response = self.client.post("/api/products", headers=self.headers, json={
+            "name": "Emma", "price": 4.5, "category_id": self.category.category_id
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.client.get(listing, headers=self.headers).json["data"]), 2)
+
+    def test_deleted_category_rejected(self):
+        """Test category deleted by other worker is rejected at once."""
+        category_id = self.category.category_id
+        with count_queries(db.get_engine(self.app)) as statements:
+            response = self.client.post("/api/products", headers=self.headers, json={
+                "name": "Emma", "price": 4.5, "category_id": category_id
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len([statement for statement in statements if "FROM product_categories" in statement]), 1)
+
+        db.session.execute(ProductCategory.__table__.delete())
+        db.session.commit()
+        response = self.client.post("/api/products", headers=self.headers, json={
+            "name": "Persuasion", "price": 4.5, "category_id": category_id
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_product_invalidated_on_delete(self):
+        """Test deleted product is not served from cache."""
+        url = f"/api/products/{self.product.product_id}"
+        self.client.get(url, headers=self.headers)
+        self.client.delete(url, headers=self.headers)
+        self.assertEqual(self.client.get(url, headers=self.headers).status_code, 404)
+
+    def test_search(self):
+        """Test products full-text search follows product writes."""
+        product_id = self.product.product_id
+        for name in ["Dune Messiah", "Children of Dune", "Emma"]:
+            self.client.post("/api/products", headers=self.headers, json={
+                "name": name, "price": 1.0, "category_id": self.category.category_id
+            })
+        response = self.client.get("/api/products/search?q=dun&per_page=2", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json["data"]), 2)
+        self.assertIn("score", response.json["data"][0])
+        cursor = response.json["pagination"]["next_cursor"]
+        response = self.client.get(f"/api/products/search?q=dun&per_page=2&after={cursor}", headers=self.headers)
+        self.assertEqual(len(response.json["data"]), 1)
+        self.assertIsNone(response.json["pagination"]["next_cursor"])
+
+        self.client.put(f"/api/products/{product_id}", headers=self.headers, json={"name": "Arrakis"})
+        response = self.client.get("/api/products/search?q=arrakis", headers=self.headers)
+        self.assertEqual(response.json["data"][0]["product_id"], product_id)
+        self.client.delete(f"/api/products/{product_id}", headers=self.headers)
+        response = self.client.get("/api/products/search?q=arrakis", headers=self.headers)
+        self.assertEqual(response.json["data"], [])
+
+    def test_reindex_command(self):
+        """Test full-text index rebuild command."""
+        product_id = self.product.product_id
+        result = self.app.test_cli_runner().invoke(args=["catalog", "reindex", "--batch-size", "1"])
+        self.assertIn("indexed 1 products", result.output)
+        products, _ = search.search_products("dune")
+        self.assertEqual(products[0].product_id, product_id)
+
+    def test_listing_filters(self):
+        """Test category products price filters, name prefix and sort orders."""
+        category_id = self.category.category_id
+        db.session.add_all([
+            Product(name=name, price=price, category_id=category_id)
+            for name, price in [("Emma", 4.5), ("Dracula", 4.5), ("Beloved", 12.0), ("Ulysses", 2.0)]
+        ])
+        db.session.commit()
+        listing = f"/api/category/{category_id}/products"
+
+        response = self.client.get(f"{listing}?sort=price", headers=self.headers)
+        self.assertEqual([p["name"] for p in response.json["data"]], ["Ulysses", "Emma", "Dracula", "Dune", "Beloved"])
+        response = self.client.get(f"{listing}?sort=-price&min_price=3&max_price=10", headers=self.headers)
+        self.assertEqual([p["name"] for p in response.json["data"]], ["Dune", "Dracula", "Emma"])
+        response = self.client.get(f"{listing}?sort=name&q=D", headers=self.headers)
+        self.assertEqual([p["name"] for p in response.json["data"]], ["Dracula", "Dune"])
+        self.assertEqual(self.client.get(f"{listing}?sort=size", headers=self.headers).status_code, 400)
+
+    def test_name_prefix(self):
+        """Test name prefix is case sensitive and uses LIKE outside SQLite."""
+        listing = f"/api/category/{self.category.category_id}/products"
+        response = self.client.get(f"{listing}?q=d", headers=self.headers)
+        self.assertEqual(response.json["data"], [])
+        with mock.patch.object(db.engine.dialect, "name", "postgresql"):
+            clause = name_prefix("50%_off")
+        sql = str(clause.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+        self.assertEqual(sql, "products.name LIKE '50/%%/_off' || '%%' ESCAPE '/'")
+
+    def test_listing_sorted_cursor(self):
+        """Test keyset cursor walks sorted listing with equal prices."""
+        category_id = self.category.category_id
+        db.session.add_all([
+            Product(name=name, price=price, category_id=category_id)
+            for name, price in [("Emma", 4.5), ("Dracula", 4.5), ("Beloved", 12.0), ("Ulysses", 2.0)]
+        ])
+        db.session.commit()
+        listing = f"/api/category/{category_id}/products"
+
+        for sort, expected in [("price", ["Ulysses", "Emma", "Dracula", "Dune", "Beloved"]),
+                               ("-price", ["Beloved", "Dune", "Dracula", "Emma", "Ulysses"])]:
+            names, after = [], "0"
+            while after is not None:
+                response = self.client.get(f"{listing}?sort={sort}&per_page=2&after={after}", headers=self.headers)
+                self.assertEqual(response.status_code, 200)
+                names += [p["name"] for p in response.json["data"]]
+                after = response.json["pagination"]["next_cursor"]
+            self.assertEqual(names, expected)
+
+    def test_batch_lookup(self):
+        """Test products lookup by ids keeps order and reports missing ids."""
+        first_id = self.product.product_id
+        emma = Product(name="Emma", price=4.5, category=self.category)
+        db.session.add(emma)
+        db.session.commit()
+        second_id = emma.product_id
+
+        response = self.client.get(f"/api/products?ids={second_id},999,{first_id},{second_id}", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product["product_id"] for product in response.json["data"]], [second_id, first_id])
+        self.assertEqual(response.json["missing"], [999])
+
+        response = self.client.post("/api/products/batch", headers=self.headers, json={"ids": [first_id, 998]})
+        self.assertEqual(response.json["data"][0]["name"], "Dune")
+        self.assertEqual(response.json["missing"], [998])
+
+        response = self.client.post("/api/products/batch", headers=self.headers, json={"ids": list(range(501))})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get("/api/products?ids=1,x", headers=self.headers).status_code, 400)
+
+    def test_bulk_import_csv(self):
+        """Test CSV import inserts valid rows and reports invalid ones."""
+        category_id = self.category.category_id
+        listing = f"/api/category/{category_id}/products"
+        self.client.get(listing, headers=self.headers)
+        body = "name,description,price,category_id\n" \
+            f"Emma,Novel,4.5,{category_id}\n" \
+            f",No name,1,{category_id}\n" \
+            f"Persuasion,,abc,{category_id}\n" \
+            "Sanditon,,3,999\n" \
+            f"Dune Messiah,Sci-fi,7,{category_id}\n"
+        response = self.client.post("/api/products/bulk", headers={**self.headers, "Content-Type": "text/csv"}, data=body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["imported"], 2)
+        self.assertEqual(response.json["failed"], 3)
+        self.assertEqual([error["row"] for error in response.json["errors"]], [2, 3, 4])
+        self.assertIn("name", response.json["errors"][0]["errors"])
+        self.assertIn("price", response.json["errors"][1]["errors"])
+        self.assertIn("category_id", response.json["errors"][2]["errors"])
+
+        self.assertEqual(len(self.client.get(listing, headers=self.headers).json["data"]), 3)
+        products, _ = search.search_products("messiah")
+        self.assertEqual(products[0].name, "Dune Messiah")
+
+    def test_bulk_import_malformed_csv(self):
+        """Test rows with invalid UTF-8 or malformed CSV are reported, not failing import."""
+        category_id = self.category.category_id
+        body = b"name,price,category_id\n" \
+            b"Emma\xff,4.5,%d\n" \
+            b"%s,1,%d\n" \
+            b"Sanditon,3,%d\n" % (category_id, b"x" * (csv.field_size_limit() + 1), category_id, category_id)
+        response = self.client.post("/api/products/bulk", headers={**self.headers, "Content-Type": "text/csv"}, data=body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["imported"], 1)
+        self.assertEqual([error["row"] for error in response.json["errors"]], [1, 2])
+
+    def test_bulk_import_csv_bom(self):
+        """Test CSV exported with BOM is imported."""
+        body = "\ufeffname,price,category_id\nEmma,4.5,%d\n" % self.category.category_id
+        response = self.client.post("/api/products/bulk", headers={**self.headers, "Content-Type": "text/csv"},
+                                    data=body.encode())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json["imported"], response.json["failed"]), (1, 0))
+
+    def test_bulk_import_ndjson(self):
+        """Test NDJSON import in several chunks."""
+        category_id = self.category.category_id
+        body = "\n".join([
+            f'{{"name": "Emma", "price": 4.5, "category_id": {category_id}}}',
+            "not json",
+            f'{{"name": "Persuasion", "price": 3, "category_id": {category_id}}}',
+            f'{{"name": "Lady Susan", "price": 3, "category_id": {category_id + 0.7}}}',
+            f'{{"name": "Sanditon", "price": 2, "category_id": {category_id}}}',
+            f'{{"name": "Watsons", "price": 2, "category_id": {float(category_id)}}}'
+        ]).encode() + b'\n{"name": "\xff"}'
+        with mock.patch("api.products.import_products", partial(import_products, chunk_size=2)):
+            with count_queries(db.get_engine(self.app)) as statements:
+                response = self.client.post("/api/products/bulk", headers={**self.headers, "Content-Type": "application/x-ndjson"}, data=body)
+        self.assertEqual(response.json["imported"], 4)
+        self.assertEqual(response.json["errors"], [
+            {"row": 2, "errors": {"_record": ["Invalid record."]}},
+            {"row": 4, "errors": {"category_id": ["Not a valid integer."]}},
+            {"row": 7, "errors": {"_record": ["Invalid record."]}}
+        ])
+        self.assertEqual(len([statement for statement in statements if statement.startswith("INSERT INTO products ")]), 2)
+        self.assertEqual(Product.query.count(), 5)
+
+        response = self.client.post("/api/products/bulk", headers={**self.headers, "Content-Type": "text/plain"}, data=body)
+        self.assertEqual(response.status_code, 415)
+
+    def test_import_command(self):
+        """Test products import command."""
+        category_id = self.category.category_id
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w") as f:
+            f.write("name,price,category_id\n")
+            for i in range(5):
+                f.write(f"Book {i},1,{category_id}\n")
+            f.write("Book,1,999\n")
+        try:
+            result = self.app.test_cli_runner().invoke(args=["catalog", "import", path, "--chunk-size", "2"])
+        finally:
+            os.remove(path)
+        self.assertIn("Row 6:", result.output)
+        self.assertIn("imported 5 products, 1 failed", result.output)
+        self.assertEqual(len(search.search_products("book", per_page=10)[0]), 5)
+
+    def test_export(self):
+        """Test catalog export streams all products in chunks."""
+        category_id = self.category.category_id
+        db.session.add_all([Product(name=f"Book {i}", price=i, category_id=category_id) for i in range(5)])
+        db.session.commit()
+
+        response = self.client.get("/api/products/export", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        self.assertTrue(response.is_streamed)
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([row["name"] for row in rows], ["Dune"] + [f"Book {i}" for i in range(5)])
+        self.assertIsNotNone(rows[0]["updated_at"])
+
+        response = self.client.get("/api/products/export?format=csv", headers=self.headers)
+        self.assertEqual(response.mimetype, "text/csv")
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]["name"], "Dune")
+
+    def test_export_updated_since(self):
+        """Test incremental export returns only changed products."""
+        product_id = self.product.product_id
+        since = datetime.utcnow() + timedelta(seconds=1)
+        response = self.client.get(f"/api/products/export?updated_since={since.isoformat()}", headers=self.headers)
+        self.assertEqual(response.get_data(), b"")
+
+        self.product.updated_at = datetime.utcnow() - timedelta(days=1)
+        db.session.commit()
+        since = datetime.utcnow() - timedelta(hours=1)
+        self.client.put(f"/api/products/{product_id}", headers=self.headers, json={"price": 1.0})
+        self.client.post("/api/products", headers=self.headers, json={
+            "name": "Emma", "price": 4.5, "category_id": self.category.category_id
+        })
+        response = self.client.get(f"/api/products/export?updated_since={since.isoformat()}Z", headers=self.headers)
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([row["name"] for row in rows], ["Dune", "Emma"])
+
+    def tearDown(self):
+        """Instructions that will be executed after each test method"""
+        db.drop_all()
+        self.app_context.pop()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from threading import Thread
+from time import sleep
+
+from api import create_app, token_store
+from api.models import db, User, Token
+from api.token_stores import serve_token_table, TokenStore
+from config import TestConfig
+
+
+class MemoryTestConfig(TestConfig):
+    """Application test config with in-memory token store."""
+    TOKEN_STORE = "memory"
+
+
+class MemoryTokenStoreTestCase(unittest.TestCase):
+    """Test case for in-memory token store."""
+    config = MemoryTestConfig
+
+    def setUp(self):
+        """Instructions that will be executed before each test method."""
+        self.app = create_app(self.config)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.u = User(
+            username="bob",
+            email="bob@example.com",
+            password="cat"
+        )
+        db.session.add(self.u)
+        db.session.commit()
+        self.token = self.u.generate_access_token()
+        token_store.save(self.token)
+
+    def test_tokens_not_in_database(self):
+        """Test tokens table stays empty."""
+        db.session.commit()
+        self.assertEqual(Token.query.count(), 0)
+
+    def test_access_token_correct(self):
+        """Test access token is verified from store."""
+        self.assertEqual(User.verify_access_token(self.token.access_token), self.u)
+        self.assertIsNone(User.verify_access_token("invalid"))
+
+    def test_refresh_token_correct(self):
+        """Test refresh token is verified from store."""
+        token = User.verify_refresh_token(self.token.refresh_token, self.token.access_token)
+        self.assertEqual(token.user_id, self.u.user_id)
+        self.assertIsNone(User.verify_refresh_token(self.token.refresh_token, "invalid"))
+
+    def test_expire(self):
+        """Test expired token is persisted in store."""
+        self.token.expire()
+        self.assertIsNone(User.verify_access_token(self.token.access_token))
+
+    def test_revoke_all(self):
+        """Test all user tokens are revoked."""
+        self.u.revoke_all()
+        self.assertIsNone(token_store.get(self.token.access_token))
+
+    def test_store_interface(self):
+        """Test token store must implement the whole interface."""
+        class PartialStore(TokenStore):
+            def save(self, token):
+                pass
+
+        with self.assertRaises(TypeError):
+            PartialStore()
+
+    def test_clean(self):
+        """Test tokens are deleted after long expiration."""
+        self.token.refresh_expiration = datetime.utcnow() - timedelta(days=2)
+        token_store.save(self.token)
+        self.assertEqual(Token.clean(), 1)
+        self.assertIsNone(token_store.get(self.token.access_token))
+
+    def tearDown(self):
+        """Instructions that will be executed after each test method"""
+        db.drop_all()
+        self.app_context.pop()
+
+
+class SharedTestConfig(TestConfig):
+    """Application test config with shared token store."""
+    TOKEN_STORE = "shared"
+    TOKEN_STORE_ADDRESS = os.path.join(tempfile.mkdtemp(), "tokens.sock")
+
+
+class SharedTokenStoreTestCase(MemoryTokenStoreTestCase):
+    """Test case for token store shared over local socket."""
+    config = SharedTestConfig
+
+    @classmethod
+    def setUpClass(cls):
+        """Start token store server."""
+        address = cls.config.TOKEN_STORE_ADDRESS
+        Thread(target=serve_token_table, args=[address, cls.config.SECRET_KEY.encode()], daemon=True).start()
+        while not os.path.exists(address):
+            sleep(0.01)
+
+    def test_shared_between_stores(self):
+        """Test token saved by one application is visible to another."""
+        other = create_app(self.config)
+        with other.app_context():
+            self.assertEqual(token_store.get(self.token.access_token).user_id, self.u.user_id)
@@ -4,9 +4,11 @@ from datetime import datetime, timedelta
 from time import sleep
 
 from api import create_app
-from api.models import db, User, Token
-from api.tokens import token_response
+from api import revoked_tokens, token_cache
+from api.models import db, RevokedToken, User, Token
+from api.tokens import sweeper, token_response
 from config import TestConfig
+from tests import count_queries
 
 
 class TokensTestCase(unittest.TestCase):
@@ -59,6 +61,58 @@ class TokensTestCase(unittest.TestCase):
         db.session.commit()
         self.assertFalse(self.u.tokens.all())
 
+    def test_access_token_cached(self):
+        """Test verified access token is served from cache."""
+        User.verify_access_token(self.token.access_token)
+        hits = token_cache.hits
+        u = User.verify_access_token(self.token.access_token)
+        self.assertEqual(token_cache.hits, hits + 1)
+        self.assertEqual(u.user_id, self.u.user_id)
+
+    def test_cache_invalidated_on_expire(self):
+        """Test expired token is removed from cache."""
+        User.verify_access_token(self.token.access_token)
+        self.token.expire()
+        db.session.commit()
+        self.assertIsNone(token_cache.get(self.token.access_token))
+        self.assertIsNone(User.verify_access_token(self.token.access_token))
+
+    def test_cache_invalidated_on_revoke_all(self):
+        """Test revoked tokens are removed from cache."""
+        access_token = self.token.access_token
+        User.verify_access_token(access_token)
+        self.u.revoke_all()
+        db.session.commit()
+        self.assertIsNone(User.verify_access_token(access_token))
+
+    def test_clean_in_batches(self):
+        """Test expired tokens are deleted in several batches."""
+        yesterday = datetime.utcnow() - timedelta(days=2)
+        for _ in range(5):
+            token = self.u.generate_access_token()
+            token.refresh_expiration = yesterday
+            db.session.add(token)
+        db.session.commit()
+        self.assertEqual(Token.clean(batch_size=2), 5)
+        self.assertEqual(self.u.tokens.count(), 1)
+
+    def test_sweep_command(self):
+        """Test tokens sweep command."""
+        self.token.refresh_expiration = datetime.utcnow() - timedelta(days=2)
+        db.session.commit()
+        result = self.app.test_cli_runner().invoke(args=["tokens", "sweep"])
+        self.assertIn("deleted 1 expired tokens", result.output)
+
+    def test_sweeper_started_by_request(self):
+        """Test enabled sweeper is started by first request, not by app creation."""
+        app = create_app(type("SweepConfig", (self.config,), {"TOKENS_SWEEP_INTERVAL": 60}))
+        self.assertFalse(sweeper._thread and sweeper._thread.is_alive())
+        app.test_client().get("/api/products")
+        try:
+            self.assertTrue(sweeper._thread.is_alive())
+        finally:
+            sweeper.stop()
+
     def test_token_response(self):
         """Test token response."""
         with self.app.test_request_context():
@@ -71,6 +125,80 @@ class TokensTestCase(unittest.TestCase):
 
     def tearDown(self):
         """Instructions that will be executed after each test method"""
+        db.session.remove()
         db.drop_all()
         self.app_context.pop()
-        
\ No newline at end of file
+        
+
+class SignedTestConfig(TestConfig):
+    """Application test config with signed access tokens."""
+    SIGNED_ACCESS_TOKENS = True
+
+
+class SignedTokensTestCase(TokensTestCase):
+    """Test case for signed access tokens."""
+    config = SignedTestConfig
+
+    def test_verified_without_token_row(self):
+        """Test signed access token is verified without tokens table."""
+        access_token = self.token.access_token
+        Token.query.delete()
+        db.session.commit()
+        token_cache.clear()
+        self.assertEqual(User.verify_access_token(access_token), self.u)
+
+    def test_revocation_shared(self):
+        """Test revoked token is rejected by other workers and after restart."""
+        access_token = self.token.access_token
+        self.token.expire()
+        db.session.commit()
+        token_cache.clear()
+        revoked_tokens.init_app(self.app)
+        self.assertIsNone(User.verify_access_token(access_token))
+        self.assertEqual(RevokedToken.query.count(), 1)
+
+    def test_revoke_all_shared(self):
+        """Test tokens issued before revoking all are rejected, new ones are not."""
+        access_token = self.token.access_token
+        self.u.revoke_all()
+        db.session.commit()
+        token = self.u.generate_access_token()
+        token_cache.clear()
+        revoked_tokens.init_app(self.app)
+        self.assertIsNone(User.verify_access_token(access_token))
+        self.assertEqual(User.verify_access_token(token.access_token), self.u)
+
+    def test_revocations_checked_in_memory(self):
+        """Test verification loads only the user and revocations of other
+        workers are picked up on next sync."""
+        token_cache.clear()
+        User.verify_access_token(self.token.access_token)
+        token_cache.clear()
+        user_id, access_token = self.u.user_id, self.token.access_token
+        db.session.expunge_all()
+        with count_queries(db.get_engine(self.app)) as statements:
+            self.assertEqual(User.verify_access_token(access_token).user_id, user_id)
+        self.assertEqual(len(statements), 1)
+        self.assertIn("FROM users", statements[0])
+
+        db.session.add(RevokedToken(signature=access_token.rsplit(".", 1)[1],
+                                    expiration=datetime.utcnow() + timedelta(minutes=1)))
+        db.session.commit()
+        token_cache.clear()
+        self.assertIsNotNone(User.verify_access_token(access_token))
+        token_cache.clear()
+        revoked_tokens.sync()
+        self.assertIsNone(User.verify_access_token(access_token))
+
+    def test_revoked_tokens_cleaned(self):
+        """Test expired revoked tokens are deleted by sweep."""
+        db.session.add(RevokedToken(signature="old", expiration=datetime.utcnow() - timedelta(minutes=1)))
+        self.token.expire()
+        db.session.commit()
+        Token.clean()
+        self.assertEqual([token.signature for token in RevokedToken.query], [self.token.access_token.rsplit(".", 1)[1]])
+
+    def test_tampered_token(self):
+        """Test signed access token with forged user id is rejected."""
+        _, rest = self.token.access_token.split(".", 1)
+        self.assertIsNone(User.verify_access_token("2." + rest))
@@ -1,7 +1,11 @@
 import unittest
+from datetime import datetime, timedelta
 from time import sleep
 
-from api import create_app
+from werkzeug.security import generate_password_hash
+
+from api import create_app, last_seen, password_hasher
+from api.hashing import HasherBusy, PasswordHasher
 from api.models import db, User
 from config import TestConfig 
 
@@ -29,6 +33,54 @@ class UserTestCase(unittest.TestCase):
         self.assertTrue(self.u.verify_password("cat"))
         self.assertFalse(self.u.verify_password("dog"))
 
+    def test_outdated_hash_upgraded(self):
+        """Test password hash with outdated parameters is upgraded on successful login."""
+        self.u.password_hash = generate_password_hash("cat", "pbkdf2:sha256:1000")
+        self.assertFalse(self.u.verify_password("dog"))
+        self.assertTrue(self.u.password_hash.startswith("pbkdf2:sha256:1000$"))
+        self.assertTrue(self.u.verify_password("cat"))
+        self.assertTrue(self.u.password_hash.startswith(self.app.config["PASSWORD_HASH_METHOD"] + "$"))
+        self.assertTrue(self.u.verify_password("cat"))
+
+    def test_hashing_process_pool(self):
+        """Test password hashing in worker processes."""
+        self.app.config["PASSWORD_HASH_WORKERS"] = 1
+        hasher = PasswordHasher()
+        hasher.init_app(self.app)
+        try:
+            pwhash = hasher.hash("cat")
+            self.assertTrue(hasher.verify(pwhash, "cat"))
+            self.assertFalse(hasher.verify(pwhash, "dog"))
+            self.assertFalse(hasher.needs_rehash(pwhash))
+        finally:
+            hasher.shutdown()
+
+    def test_hashing_busy(self):
+        """Test saturated hashing pool raises domain error, mapped to 503 by views."""
+        self.app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_TIMEOUT=0)
+        password_hasher.init_app(self.app)
+        for _ in range(2):
+            password_hasher._slots.acquire()
+        try:
+            with self.assertRaises(HasherBusy):
+                User(username="alice", email="alice@example.com", password="cat")
+            db.session.rollback()
+            response = self.app.test_client().post("/api/users", json={
+                "username": "alice", "email": "alice@example.com", "password": "cat"
+            })
+            self.assertEqual(response.status_code, 503)
+        finally:
+            password_hasher.shutdown()
+
+    def test_benchmark_hash(self):
+        """Test hash benchmark runs through the hashing pool."""
+        self.app.config["PASSWORD_HASH_WORKERS"] = 1
+        result = self.app.test_cli_runner().invoke(args=[
+            "users", "benchmark-hash", "--method", "pbkdf2:sha256:1000", "--rounds", "2"
+        ])
+        self.assertIn("pbkdf2:sha256:1000: ", result.output)
+        self.assertIn("hashes/sec", result.output)
+
     def test_cant_access_password(self):
         """Test password field is inaccessible."""
         with self.assertRaises(AttributeError):
@@ -42,6 +94,22 @@ class UserTestCase(unittest.TestCase):
         db.session.commit()
         self.assertTrue(last_seen < self.u.last_seen)
 
+    def test_last_seen_buffered(self):
+        """Test authenticated requests update last_seen in one batched write."""
+        token = self.u.generate_access_token()
+        self.u.last_seen = datetime.utcnow() - timedelta(hours=1)
+        db.session.add(token)
+        db.session.commit()
+        seen = self.u.last_seen
+
+        User.verify_access_token(token.access_token)
+        User.verify_access_token(token.access_token)
+        self.assertFalse(db.session.dirty)
+        self.assertEqual(last_seen.flush(), 1)
+        db.session.refresh(self.u)
+        self.assertTrue(self.u.last_seen > seen)
+        self.assertEqual(last_seen.flush(), 0)
+
     def test_password_salts_are_random(self):
         """Test password hash salts are random."""
         u2 = User(
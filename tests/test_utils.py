@@ -1,7 +1,8 @@
 import unittest
 
 from api import create_app
-from api.utils import paginated_response, checkout_response
+from api.models import db, User
+from api.utils import decode_cursor, encode_cursor, keyset_paginate, paginated_response, checkout_response
 
 from config import TestConfig
 
@@ -14,6 +15,7 @@ class UtilsTestCase(unittest.TestCase):
         self.app = create_app(self.config)
         self.app_context = self.app.app_context()
         self.app_context.push()
+        db.create_all()
 
     def test_paginated_response(self):
         """Test pagination response."""
@@ -26,6 +28,72 @@ class UtilsTestCase(unittest.TestCase):
         self.assertTrue(code == 200)
         self.assertIsNone(headers)
 
+    def test_keyset_paginate(self):
+        """Test cursor pagination walks all rows once."""
+        for i in range(5):
+            db.session.add(User(username=f"user{i}", email=f"user{i}@example.com"))
+        db.session.commit()
+
+        users, pagination = keyset_paginate(User.query, [User.user_id], "0", 2, with_total=True)
+        self.assertEqual([u.username for u in users], ["user0", "user1"])
+        self.assertEqual(pagination["total"], 5)
+        seen = [u.user_id for u in users]
+        while pagination["next_cursor"]:
+            users, pagination = keyset_paginate(User.query, [User.user_id], pagination["next_cursor"], 2)
+            self.assertIsNone(pagination["total"])
+            seen += [u.user_id for u in users]
+        self.assertEqual(seen, sorted(set(seen)))
+        self.assertEqual(len(seen), 5)
+
+    def test_keyset_paginate_descending(self):
+        """Test cursor pagination on composite key in descending order."""
+        for i in range(3):
+            db.session.add(User(username=f"user{i}", email=f"user{i}@example.com", name="same"))
+        db.session.commit()
+
+        columns = [User.name, User.user_id]
+        users, pagination = keyset_paginate(User.query, columns, None, 2, descending=True)
+        self.assertEqual([u.username for u in users], ["user2", "user1"])
+        users, pagination = keyset_paginate(User.query, columns, pagination["next_cursor"], 2, descending=True)
+        self.assertEqual([u.username for u in users], ["user0"])
+        self.assertIsNone(pagination["next_cursor"])
+
+    def test_keyset_paginate_null_names(self):
+        """Test cursor pagination keeps rows with NULL in sort column."""
+        for i, name in enumerate([None, "bob", None, "alice", None]):
+            db.session.add(User(username=f"user{i}", email=f"user{i}@example.com", name=name))
+        db.session.commit()
+
+        columns = [User.name, User.user_id]
+        for descending, expected in [(False, ["user0", "user2", "user4", "user3", "user1"]),
+                                     (True, ["user1", "user3", "user4", "user2", "user0"])]:
+            users, pagination = keyset_paginate(User.query, columns, None, 2, descending=descending)
+            seen = [u.username for u in users]
+            while pagination["next_cursor"]:
+                users, pagination = keyset_paginate(
+                    User.query, columns, pagination["next_cursor"], 2, descending=descending
+                )
+                seen += [u.username for u in users]
+            self.assertEqual(seen, expected)
+
+    def test_cursor_encoding(self):
+        """Test keyset cursor round trip."""
+        self.assertEqual(encode_cursor([42]), "42")
+        self.assertEqual(decode_cursor(encode_cursor([9.99, 3]), 2), [9.99, 3])
+
+    def test_users_cursor_endpoint(self):
+        """Test users listing in cursor mode."""
+        user = User(username="bob", email="bob@example.com", password="cat")
+        token = user.generate_access_token()
+        db.session.add(token)
+        db.session.commit()
+        client = self.app.test_client()
+        response = client.get("/api/users?after=0&per_page=1",
+                              headers={"Authorization": f"Bearer {token.access_token}"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json["pagination"]["next_cursor"], None)
+        self.assertEqual(response.json["data"][0]["username"], "bob")
+
     def test_checkout_response(self):
         """Test checkout session response."""
         response = checkout_response("http://checkout.com")
@@ -33,4 +101,5 @@ class UtilsTestCase(unittest.TestCase):
 
     def tearDown(self):
         """Instructions that will be executed after each test method"""
+        db.drop_all()
         self.app_context.pop()